@@ -0,0 +1,326 @@
+import argparse
+import itertools
+import json
+import queue
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+# ========================================================================
+#              ЛОКАЛЬНАЯ ЗАМЕНА TELEGRAM BOT API ДЛЯ НАГРУЗКИ
+# ========================================================================
+#
+# Отвечает на методы, которые использует бот, в формате Bot API.
+# Задержка, доля ошибок 500 и доля ответов 429 настраиваются.
+# Нагрузочный тест кладёт сюда апдейты (бот забирает их через getUpdates)
+# и ждёт ответы бота через subscribe().
+#
+# Запуск отдельно:  python bench/fake_api.py --port 8081 --latency 0.05
+# Бот:              TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+
+BOT_USER = {"id": 999000, "is_bot": True, "first_name": "BenchBot", "username": "bench_bot"}
+
+# Методы, которые считаются ответом бота пользователю
+RESPONSE_METHODS = {
+    "sendmessage", "sendphoto", "sendmediagroup", "senddocument", "copymessage",
+    "editmessagetext", "editmessagecaption", "editmessagemedia", "editmessagereplymarkup",
+}
+# Служебные методы: без задержки и без внедрённых ошибок
+SERVICE_METHODS = {"getupdates", "getme", "deletewebhook", "setwebhook", "logout", "close"}
+
+PATH_RE = re.compile(r"^/bot(?P<token>[^/]+)/(?P<method>[A-Za-z]+)$")
+
+
+def _chat_type(chat_id):
+    return "private" if chat_id > 0 else ("channel" if str(chat_id).startswith("-100") else "group")
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, member_ratio=0.5, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.member_ratio = member_ratio
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._updates_cond = threading.Condition(self._lock)
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._subscribers = {}
+        self.calls = {}
+        self.injected = {"errors": 0, "rate_limited": 0}
+
+    # ------------------------- со стороны теста -------------------------
+
+    def push_update(self, update):
+        with self._updates_cond:
+            update = dict(update, update_id=next(self._update_ids))
+            self._updates.append(update)
+            self._updates_cond.notify_all()
+        return update["update_id"]
+
+    def subscribe(self, key):
+        """
+        Очередь ответов бота: key — chat_id или "cq:<id>" для answerCallbackQuery.
+        Элементы: (время, метод, результат).
+        """
+        with self._lock:
+            return self._subscribers.setdefault(key, queue.Queue())
+
+    def unsubscribe(self, key):
+        with self._lock:
+            self._subscribers.pop(key, None)
+
+    def _publish(self, key, method, result):
+        subscriber = self._subscribers.get(key)
+        if subscriber is not None:
+            subscriber.put((time.monotonic(), method, result))
+
+    def is_member(self, user_id):
+        # Детерминированно: одна и та же доля пользователей «подписана»
+        return (int(user_id) * 7919 % 1000) < self.member_ratio * 1000
+
+    # --------------------------- со стороны бота ---------------------------
+
+    def _message(self, chat_id, **fields):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": _chat_type(chat_id)},
+            "from": BOT_USER,
+        }
+        message.update(fields)
+        return message
+
+    def _photo(self):
+        file_id = f"fake-photo-{next(self._file_ids)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}]
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + timeout
+        with self._updates_cond:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._updates_cond.wait(timeout=remaining)
+            return self._updates[:limit]
+
+    def _result(self, method, params):
+        chat_id = _as_int(params.get("chat_id"))
+        result = self._base_result(method, params, chat_id)
+        # Как и Telegram, возвращаем кнопки в отправленном сообщении
+        if isinstance(result, dict) and params.get("reply_markup"):
+            markup = params["reply_markup"]
+            result["reply_markup"] = json.loads(markup) if isinstance(markup, str) else markup
+        return result
+
+    def _base_result(self, method, params, chat_id):
+        if method == "getupdates":
+            return self._get_updates(params)
+        if method == "getme":
+            return BOT_USER
+        if method in ("deletewebhook", "setwebhook", "logout", "close",
+                      "deletemessage", "deletemessages", "answercallbackquery"):
+            return True
+        if method == "sendmessage":
+            return self._message(chat_id, text=params.get("text", ""))
+        if method == "sendphoto":
+            return self._message(chat_id, photo=self._photo(), caption=params.get("caption"))
+        if method == "sendmediagroup":
+            media = json.loads(params.get("media") or "[]")
+            group_id = str(next(self._file_ids))
+            return [self._message(chat_id, photo=self._photo(), media_group_id=group_id) for _ in media]
+        if method == "senddocument":
+            return self._message(chat_id, document={"file_id": "fake-doc", "file_unique_id": "fake-doc"})
+        if method.startswith("editmessage"):
+            fields = {"message_id": _as_int(params.get("message_id"))}
+            if method == "editmessagetext":
+                fields["text"] = params.get("text", "")
+            elif method == "editmessagemedia":
+                fields["photo"] = self._photo()
+            else:
+                fields["text"] = ""
+            message = self._message(chat_id, **fields)
+            message["edit_date"] = int(time.time())
+            return message
+        if method == "getchatmember":
+            user_id = _as_int(params.get("user_id"))
+            status = "member" if self.is_member(user_id) else "left"
+            return {"status": status, "user": {"id": user_id, "is_bot": False, "first_name": "User"}}
+        return True
+
+    def handle(self, method, params):
+        """
+        Возвращает (HTTP-статус, тело ответа).
+        """
+        method = method.lower()
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method not in SERVICE_METHODS:
+            time.sleep(self.latency + self._random.uniform(0, self.jitter))
+            roll = self._random.random()
+            if roll < self.rate_limit_rate:
+                with self._lock:
+                    self.injected["rate_limited"] += 1
+                return 429, {
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }
+            if roll < self.rate_limit_rate + self.error_rate:
+                with self._lock:
+                    self.injected["errors"] += 1
+                return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+
+        result = self._result(method, params)
+
+        with self._lock:
+            if method == "answercallbackquery":
+                self._publish(f"cq:{params.get('callback_query_id')}", method, result)
+            elif method in RESPONSE_METHODS:
+                self._publish(_as_int(params.get("chat_id")), method, result)
+        return 200, {"ok": True, "result": result}
+
+    def stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "injected": dict(self.injected)}
+
+
+def _parse_body(content_type, body):
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=default_policy).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                params[name] = "<file>"
+            else:
+                value = part.get_content()
+                params[name] = value.decode("utf-8") if isinstance(value, bytes) else value
+        return params
+    return dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+
+
+class FakeApiServer:
+    def __init__(self, telegram, host="127.0.0.1", port=0):
+        self.telegram = telegram
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        telegram = self.telegram
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle(self):
+                # Бот, остановленный посреди long polling, просто рвёт соединение
+                try:
+                    super().handle()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                match = PATH_RE.match(url.path)
+                if not match:
+                    self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                    return
+                params = dict(parse_qsl(url.query, keep_blank_values=True))
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                params.update(_parse_body(self.headers.get("Content-Type", ""), body))
+                status, payload = telegram.handle(match.group("method"), params)
+                self._reply(status, payload)
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="базовая задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.02, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+    )
+    server = FakeApiServer(telegram, args.host, args.port).start()
+    print(f"Fake Bot API: {server.url}  (TELEGRAM_API_URL={server.url})")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(telegram.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
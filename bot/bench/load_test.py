@@ -0,0 +1,437 @@
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from fake_api import FakeApiServer, FakeTelegram
+
+
+# ========================================================================
+#                     НАГРУЗОЧНЫЙ ТЕСТ БОТА
+# ========================================================================
+#
+# Поднимает fake_api.py, запускает настоящий main.py, направив его туда
+# через TELEGRAM_API_URL, и гоняет N одновременных пользователей по
+# сценарию: /start, «Обо мне», категории, проверка подписки, голосование.
+# Задержка шага — от постановки апдейта в getUpdates до последнего
+# ожидаемого ответа бота (сообщения, правки или answerCallbackQuery).
+#
+#   python bench/load_test.py --users 50 --duration 60
+#   python bench/load_test.py --users 20 --latency 0.1 --rate-limit-rate 0.02 --json report.json
+#
+# Все данные бота (опросы, кэши, логи) пишутся во временный каталог.
+
+BENCH_DIR = Path(__file__).resolve().parent
+BOT_DIR = BENCH_DIR.parent / "main"
+MEDIA_DIR = BENCH_DIR.parents[1] / "media"
+
+BOT_TOKEN = "123456:BENCH"
+ADMIN_ID = 1
+CHANNEL_ID = -100100
+USER_ID_BASE = 1_000_000
+
+_update_stamp = itertools.count(1)
+
+
+# ========================================================================
+#                          АПДЕЙТЫ TELEGRAM
+# ========================================================================
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def text_update(user_id, text):
+    return {
+        "message": {
+            "message_id": next(_update_stamp),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        }
+    }
+
+
+def callback_update(user_id, data, message):
+    return {
+        "callback_query": {
+            "id": f"{user_id}-{next(_update_stamp)}",
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": message,
+        }
+    }
+
+
+# ========================================================================
+#                             СТАТИСТИКА
+# ========================================================================
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}   # шаг -> [секунды]
+        self.errors = {}      # шаг -> число таймаутов
+
+    def record(self, step, seconds):
+        with self._lock:
+            self.latencies.setdefault(step, []).append(seconds)
+
+    def error(self, step):
+        with self._lock:
+            self.errors[step] = self.errors.get(step, 0) + 1
+
+    def report(self, elapsed):
+        steps = sorted(set(self.latencies) | set(self.errors))
+        rows = {}
+        for step in steps:
+            values = self.latencies.get(step, [])
+            rows[step] = {
+                "count": len(values),
+                "errors": self.errors.get(step, 0),
+                "rps": len(values) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values, default=0.0) * 1000,
+            }
+        total = sum(row["count"] for row in rows.values())
+        return {
+            "elapsed_s": elapsed,
+            "steps_total": total,
+            "steps_per_s": total / elapsed if elapsed else 0.0,
+            "errors_total": sum(row["errors"] for row in rows.values()),
+            "handlers": rows,
+        }
+
+
+def print_report(report, fake_stats):
+    print()
+    print(f"{'шаг':<22}{'кол-во':>8}{'ошибки':>8}{'в сек':>8}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'max мс':>9}")
+    for step, row in report["handlers"].items():
+        print(
+            f"{step:<22}{row['count']:>8}{row['errors']:>8}{row['rps']:>8.1f}"
+            f"{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{row['p99_ms']:>9.0f}{row['max_ms']:>9.0f}"
+        )
+    print()
+    print(
+        f"Всего шагов: {report['steps_total']} за {report['elapsed_s']:.1f} с "
+        f"({report['steps_per_s']:.1f}/с), таймаутов: {report['errors_total']}"
+    )
+    print(f"Вызовы API: {json.dumps(fake_stats['calls'], sort_keys=True)}")
+    print(f"Внедрено ошибок: {fake_stats['injected']}")
+
+
+# ========================================================================
+#                          ВИРТУАЛЬНЫЙ ПОЛЬЗОВАТЕЛЬ
+# ========================================================================
+
+class Session:
+    """
+    Один пользователь в личном чате с ботом. Хранит последнее сообщение
+    бота: кнопки нажимаются на нём, как в настоящем клиенте.
+    """
+
+    def __init__(self, telegram, stats, user_id, timeout):
+        self.telegram = telegram
+        self.stats = stats
+        self.user_id = user_id
+        self.timeout = timeout
+        self.replies = telegram.subscribe(user_id)
+        self.last_message = None
+
+    def close(self):
+        self.telegram.unsubscribe(self.user_id)
+
+    def _drain(self):
+        # Запоздавшие ответы прошлого шага не должны засчитываться следующему
+        while True:
+            try:
+                self.replies.get_nowait()
+            except queue.Empty:
+                return
+
+    def _wait(self, replies, expected, started):
+        deadline = started + self.timeout
+        received = 0
+        last = None
+        while received < expected:
+            try:
+                last = replies.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return None
+            received += 1
+            _at, _method, result = last
+            if isinstance(result, list):
+                result = result[-1] if result else None
+            if isinstance(result, dict):
+                self.last_message = result
+        return last[0] - started
+
+    def step(self, name, update, expected):
+        """
+        Отправляет апдейт и ждёт expected ответов в чат пользователя.
+        """
+        self._drain()
+        started = time.monotonic()
+        self.telegram.push_update(update)
+        elapsed = self._wait(self.replies, expected, started)
+        if elapsed is None:
+            self.stats.error(name)
+            return False
+        self.stats.record(name, elapsed)
+        return True
+
+    def command(self, name, text, expected):
+        return self.step(name, text_update(self.user_id, text), expected)
+
+    def press(self, name, data, expected):
+        if self.last_message is None:
+            self.stats.error(name)
+            return False
+        return self.step(name, callback_update(self.user_id, data, self.last_message), expected)
+
+    def vote(self, name, data, poll_message):
+        """
+        Кнопка под опросом в канале: ответ — answerCallbackQuery.
+        """
+        update = callback_update(self.user_id, data, poll_message)
+        key = f"cq:{update['callback_query']['id']}"
+        answers = self.telegram.subscribe(key)
+        try:
+            started = time.monotonic()
+            self.telegram.push_update(update)
+            elapsed = self._wait(answers, 1, started)
+        finally:
+            self.telegram.unsubscribe(key)
+        if elapsed is None:
+            self.stats.error(name)
+            return False
+        self.stats.record(name, elapsed)
+        return True
+
+
+def _category_keys():
+    root = MEDIA_DIR / "works"
+    if not root.is_dir():
+        return []
+    return sorted(path.name for path in root.iterdir() if path.is_dir() and any(path.iterdir()))
+
+
+def run_user(telegram, stats, worker, deadline, args, poll_message, categories):
+    rng = random.Random(worker)
+    about_parts = 2 if (MEDIA_DIR / "welcome" / "Photo.jpg").exists() else 1
+    poll_id = poll_message and _poll_id(poll_message)
+    for iteration in itertools.count():
+        if time.monotonic() >= deadline:
+            return
+        # Каждый проход — новый пользователь: новые черновики и голоса в опросе
+        session = Session(telegram, stats, USER_ID_BASE + worker * 100_000 + iteration, args.step_timeout)
+        try:
+            scenario = [
+                lambda: session.command("/start", "/start", 1),
+                lambda: session.press("about_me", "about_me", about_parts),
+                lambda: session.press("back_main", "back_main", 1),
+                lambda: session.press("my_job", "my_job", 1),
+            ]
+            if categories:
+                category = rng.choice(categories)
+                scenario += [
+                    # Альбом (один sendMediaGroup) и заголовок с кнопкой «назад»
+                    lambda: session.press("cat_*", f"cat_{category}", 2),
+                    lambda: session.press("back_categories", "back_categories", 1),
+                ]
+            scenario += [
+                lambda: session.press("back_main", "back_main", 1),
+                lambda: session.press("check", "check", 1),
+                lambda: session.press("check_subscription", "check_subscription", 1),
+            ]
+            if poll_id:
+                option = rng.randrange(args.options)
+                scenario += [
+                    lambda: session.vote("vote:", f"vote:{poll_id}:{option}", poll_message),
+                    lambda: session.vote("vote_confirm:", f"vote_confirm:{poll_id}", poll_message),
+                ]
+            for action in scenario:
+                if time.monotonic() >= deadline:
+                    return
+                if not action():
+                    break
+                if args.think:
+                    time.sleep(rng.uniform(0, args.think))
+        finally:
+            session.close()
+
+
+# ========================================================================
+#                            ЗАПУСК БОТА
+# ========================================================================
+
+def start_bot(api_url, workdir, args):
+    # Бот ищет media/ относительно текущего каталога
+    os.symlink(MEDIA_DIR, workdir / "media")
+    data = workdir / "data"
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": api_url,
+        "CHANNEL_ID": str(CHANNEL_ID),
+        "ADMIN_ID": str(ADMIN_ID),
+        "UPDATE_MODE": "polling",
+        "VOTES_JSON_PATH": str(data / "votes.json"),
+        "VOTES_DB_PATH": str(data / "votes.db"),
+        "VOTES_ARCHIVE_DIR": str(data / "archive"),
+        "TRACKED_DB_PATH": str(data / "tracked.db"),
+        "FILE_ID_CACHE_PATH": str(data / "file_ids.json"),
+        "DERIVATIVES_DIR": str(data / "derivatives"),
+        "DERIVATIVES_ENABLED": "1" if args.derivatives else "0",
+        "WARMUP_ENABLED": "0",
+    })
+    log = open(workdir / "bot.out", "wb")
+    process = subprocess.Popen(
+        [sys.executable, str(BOT_DIR / "main.py")],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    log.close()
+    return process
+
+
+def wait_polling(telegram, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Бот завершился при запуске с кодом {process.returncode}")
+        if telegram.stats()["calls"].get("getupdates"):
+            return
+        time.sleep(0.1)
+    raise RuntimeError("Бот не начал опрашивать getUpdates")
+
+
+def stop_bot(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def _poll_id(message):
+    for row in (message.get("reply_markup") or {}).get("inline_keyboard", []):
+        for button in row:
+            data = button.get("callback_data", "")
+            if data.startswith("vote_confirm:"):
+                return data.split(":", 1)[1]
+    return None
+
+
+def create_poll(telegram, options, timeout):
+    """
+    Админ создаёт опрос в канале; возвращается сообщение опроса.
+    """
+    channel = telegram.subscribe(CHANNEL_ID)
+    try:
+        text = "/vote Bench | " + " | ".join(f"Option {i + 1}" for i in range(options))
+        telegram.push_update(text_update(ADMIN_ID, text))
+        _at, _method, message = channel.get(timeout=timeout)
+        return message
+    finally:
+        telegram.unsubscribe(CHANNEL_ID)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальном Bot API")
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность, с")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа API, с")
+    parser.add_argument("--jitter", type=float, default=0.02, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--member-ratio", type=float, default=0.5, help="доля подписанных на канал")
+    parser.add_argument("--options", type=int, default=3, help="вариантов в опросе")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза пользователя между шагами до N с")
+    parser.add_argument("--step-timeout", type=float, default=15.0, help="таймаут ожидания ответа, с")
+    parser.add_argument("--derivatives", action="store_true", help="готовить уменьшенные копии фото")
+    parser.add_argument("--json", help="записать отчёт в JSON (для CI)")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочий каталог бота")
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        member_ratio=args.member_ratio,
+    )
+    server = FakeApiServer(telegram).start()
+    workdir = Path(tempfile.mkdtemp(prefix="bot-bench-"))
+    process = start_bot(server.url, workdir, args)
+    try:
+        wait_polling(telegram, process)
+        print(f"Бот запущен (pid {process.pid}), Bot API: {server.url}, каталог: {workdir}")
+
+        poll_message = None
+        try:
+            poll_message = create_poll(telegram, args.options, args.step_timeout)
+        except queue.Empty:
+            print("Опрос не создан — шаги голосования пропускаются")
+
+        stats = Stats()
+        categories = _category_keys()
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [
+            threading.Thread(
+                target=run_user,
+                args=(telegram, stats, worker, deadline, args, poll_message, categories),
+                name=f"user-{worker}", daemon=True,
+            )
+            for worker in range(args.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        report = stats.report(elapsed)
+        report["config"] = {key: value for key, value in vars(args).items() if key not in ("json", "keep")}
+        report["api"] = telegram.stats()
+        print_report(report, report["api"])
+        if args.json:
+            Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        if process.poll() is not None:
+            print(f"Бот завершился во время теста с кодом {process.returncode}, см. {workdir / 'bot.out'}")
+            return 1
+        return 0
+    finally:
+        stop_bot(process)
+        server.stop()
+        if args.keep:
+            print(f"Рабочий каталог: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
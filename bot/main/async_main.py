@@ -0,0 +1,168 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from telebot import apihelper, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+from config import (
+    BOT_TOKEN, CHANNEL_ID, ADMIN_ID, ASYNC_REQUEST_LIMIT, ASYNC_HANDLER_THREADS, ALLOWED_UPDATES,
+    TELEGRAM_API_URL, CATALOG_REFRESH_SECONDS,
+    WARMUP_ENABLED, STORAGE_CHAT_ID, WARMUP_CONCURRENCY,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+)
+from logger import logger, logging_stats
+from metrics import registry, instrument_telebot, instrument_async_telebot, MetricsServer
+from navigation import register_navigation_handlers
+from outbox import ThrottledBot, create_outbox
+from profiling import handler_profiler, register_profiling_handlers
+from router import CallbackRouter
+from subscription import subscription_cache
+from tracked_store import create_tracked_store
+from vote_storage import create_vote_storage
+from voting import register_voting_handlers
+from warmup import warm_up
+from works import refresh_catalog, start_catalog_watcher
+
+
+# ========================================================================
+#              РЕЖИМ asyncio: ТРАНСПОРТ НА AsyncTeleBot
+# ========================================================================
+#
+# Запросы к Telegram не занимают поток на время ответа, поэтому в одном
+# процессе одновременно могут выполняться тысячи запросов. Лимит
+# соединений общей aiohttp-сессии задаётся ASYNC_REQUEST_LIMIT.
+#
+# Экраны, голосование и /slow — те же синхронные обработчики, что и в
+# потоковом режиме (navigation.py, voting.py, profiling.py). Здесь только
+# получение обновлений и SyncBotBridge, через который эти обработчики
+# работают с AsyncTeleBot. Отправки, как и в потоковом режиме, идут через
+# очередь с лимитами Telegram: ThrottledBot(SyncBotBridge, OutboundScheduler).
+
+asyncio_helper.REQUEST_LIMIT = ASYNC_REQUEST_LIMIT
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL + "/bot{0}/{1}"
+instrument_async_telebot()
+
+bot = AsyncTeleBot(BOT_TOKEN)
+router = CallbackRouter(logger)
+
+
+class SyncBotBridge:
+    """
+    Позволяет зарегистрировать синхронные обработчики на AsyncTeleBot:
+    обработчик выполняется в своём пуле потоков, а его вызовы
+    bot.send_message(...) и т.п. выполняются в цикле событий.
+    Пул по умолчанию (asyncio.to_thread) не годится: в нём aiohttp читает
+    загружаемые файлы, и обработчики, ждущие отправки альбома, заняли бы
+    его целиком.
+    Ошибки Telegram приходят как apihelper.ApiTelegramException, как и от
+    TeleBot, — общий код ловит одно исключение в обоих режимах.
+    Очередь отправки — снаружи (ThrottledBot поверх моста); мост лишь
+    принимает те же priority и wait, wait=False возвращает Future.
+    """
+
+    def __init__(self, async_bot, loop, workers):
+        self._bot = async_bot
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handler")
+
+    def _register(self, register, **kwargs):
+        def decorator(handler):
+            async def run(update):
+                await self._loop.run_in_executor(self._executor, handler, update)
+            register(run, **kwargs)
+            return handler
+        return decorator
+
+    def message_handler(self, **kwargs):
+        return self._register(self._bot.register_message_handler, **kwargs)
+
+    def callback_query_handler(self, func, **kwargs):
+        return self._register(self._bot.register_callback_query_handler, func=func, **kwargs)
+
+    def chat_member_handler(self, func, **kwargs):
+        return self._register(self._bot.register_chat_member_handler, func=func, **kwargs)
+
+    def __getattr__(self, name):
+        method = getattr(self._bot, name)
+
+        async def request(*args, **kwargs):
+            try:
+                return await method(*args, **kwargs)
+            except asyncio_helper.ApiTelegramException as e:
+                raise apihelper.ApiTelegramException(e.function_name, e.result, e.result_json) from e
+
+        def call(*args, priority=None, wait=True, **kwargs):
+            future = asyncio.run_coroutine_threadsafe(request(*args, **kwargs), self._loop)
+            return future.result() if wait else future
+        return call
+
+
+# ========================================================================
+#                          ЗАПУСК
+# ========================================================================
+
+async def _main(storage, tracked, outbox):
+    bridge = SyncBotBridge(bot, asyncio.get_running_loop(), ASYNC_HANDLER_THREADS)
+    api = ThrottledBot(bridge, outbox)
+    register_voting_handlers(api, logger, ADMIN_ID, CHANNEL_ID, storage=storage, router=router)
+    register_profiling_handlers(api, logger, ADMIN_ID)
+    register_navigation_handlers(api, logger, ADMIN_ID, CHANNEL_ID, tracked, router)
+
+    try:
+        await bot.polling(non_stop=True, allowed_updates=ALLOWED_UPDATES)
+    finally:
+        await bot.close_session()
+
+
+def run(storage, tracked):
+    outbox = create_outbox(logger)
+    registry.add_collector("outbox", outbox.stats)
+    registry.add_collector("tracked", tracked.stats)
+    registry.add_collector("subscription_cache", subscription_cache.stats)
+    registry.add_collector("profiler", handler_profiler.stats)
+    registry.add_collector("logging", logging_stats)
+    registry.add_collector("router", router.stats)
+    logger.info("Бот запущен в режиме asyncio ✔")
+    asyncio.run(_main(storage, tracked, outbox))
+
+
+def _warm_up():
+    # Прогрев синхронный и идёт до запуска цикла событий:
+    # ему хватает TeleBot без рабочих потоков
+    if TELEGRAM_API_URL:
+        apihelper.API_URL = TELEGRAM_API_URL + "/bot{0}/{1}"
+    instrument_telebot()
+    warm_up(telebot.TeleBot(BOT_TOKEN, threaded=False), STORAGE_CHAT_ID, logger, concurrency=WARMUP_CONCURRENCY)
+
+
+def main():
+    """
+    Вход режима asyncio (RUNTIME_MODE=asyncio python main.py или
+    python async_main.py): main.py с его потоковым TeleBot не импортируется.
+    """
+    if METRICS_ENABLED:
+        MetricsServer(logger, host=METRICS_HOST, port=METRICS_PORT).start()
+
+    refresh_catalog(logger=logger)
+    if CATALOG_REFRESH_SECONDS > 0:
+        start_catalog_watcher(CATALOG_REFRESH_SECONDS, logger=logger)
+
+    if WARMUP_ENABLED:
+        if STORAGE_CHAT_ID:
+            _warm_up()
+        else:
+            logger.warning("Прогрев включён, но STORAGE_CHAT_ID не задан — пропускаем")
+
+    storage = create_vote_storage(logger)
+    tracked = create_tracked_store()
+    try:
+        run(storage, tracked)
+    finally:
+        storage.close()
+        tracked.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,137 @@ def _load_env_file():
 
 _load_env_file()
 
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+
+def _env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 CHANNEL_ID = os.environ.get("CHANNEL_ID")
 ADMIN_ID = os.environ.get("ADMIN_ID")
+BOT_NUM_THREADS = _env_int("BOT_NUM_THREADS", 2)
+RUNTIME_MODE = os.environ.get("RUNTIME_MODE", "threaded").lower()
+ASYNC_REQUEST_LIMIT = _env_int("ASYNC_REQUEST_LIMIT", 1000)
+# Потоки для синхронных обработчиков в режиме asyncio
+ASYNC_HANDLER_THREADS = _env_int("ASYNC_HANDLER_THREADS", 32)
+# Другой адрес Bot API: локальный telegram-bot-api или bench/fake_api.py для нагрузочных тестов
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "").rstrip("/")
+
+UPDATE_MODE = os.environ.get("UPDATE_MODE", "polling").lower()
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+WEBHOOK_SET = _env_flag("WEBHOOK_SET", default=True)
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = _env_int("WEBHOOK_PORT", 8080)
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_QUEUE_SIZE = _env_int("WEBHOOK_QUEUE_SIZE", 1000)
+
+FILE_ID_CACHE_PATH = os.environ.get("FILE_ID_CACHE_PATH", "media/.cache/file_ids.json")
+
+WARMUP_ENABLED = _env_flag("WARMUP_ENABLED")
+STORAGE_CHAT_ID = os.environ.get("STORAGE_CHAT_ID")
+WARMUP_CONCURRENCY = _env_int("WARMUP_CONCURRENCY", 4)
+
+DERIVATIVES_ENABLED = _env_flag("DERIVATIVES_ENABLED", default=True)
+DERIVATIVES_DIR = os.environ.get("DERIVATIVES_DIR", "media/.cache/derivatives")
+DERIVATIVE_MAX_EDGE = _env_int("DERIVATIVE_MAX_EDGE", 1280)
+DERIVATIVE_QUALITY = _env_int("DERIVATIVE_QUALITY", 85)
+DERIVATIVE_FORMAT = os.environ.get("DERIVATIVE_FORMAT", "jpeg").lower()
+DERIVATIVE_WORKERS = _env_int("DERIVATIVE_WORKERS", 0)
+
+CATALOG_REFRESH_SECONDS = _env_int("CATALOG_REFRESH_SECONDS", 60)
+
+VOTES_BACKEND = os.environ.get("VOTES_BACKEND", "json").lower()
+VOTES_JSON_PATH = os.environ.get("VOTES_JSON_PATH", str(BASE_DIR / "votes.json"))
+VOTES_DB_PATH = os.environ.get("VOTES_DB_PATH", str(BASE_DIR / "data" / "votes.db"))
+VOTES_FLUSH_MODE = os.environ.get("VOTES_FLUSH_MODE", "confirm").lower()
+VOTES_FLUSH_INTERVAL = _env_float("VOTES_FLUSH_INTERVAL", 2.0)
+VOTES_FLUSH_EVERY = _env_int("VOTES_FLUSH_EVERY", 100)
+
+OUTBOX_GLOBAL_RATE = _env_float("OUTBOX_GLOBAL_RATE", 30.0)
+OUTBOX_PRIVATE_RATE = _env_float("OUTBOX_PRIVATE_RATE", 1.0)
+OUTBOX_PRIVATE_BURST = _env_int("OUTBOX_PRIVATE_BURST", 5)
+# Отдельный лимит для ответов пользователю в личке (нажатия кнопок, /start)
+OUTBOX_INTERACTIVE_RATE = _env_float("OUTBOX_INTERACTIVE_RATE", 3.0)
+OUTBOX_INTERACTIVE_BURST = _env_int("OUTBOX_INTERACTIVE_BURST", 10)
+OUTBOX_GROUP_PER_MINUTE = _env_int("OUTBOX_GROUP_PER_MINUTE", 20)
+OUTBOX_GROUP_BURST = _env_int("OUTBOX_GROUP_BURST", 3)
+OUTBOX_WORKERS = _env_int("OUTBOX_WORKERS", 8)
+OUTBOX_MAX_RETRIES = _env_int("OUTBOX_MAX_RETRIES", 3)
+
+CLEANUP_WORKERS = _env_int("CLEANUP_WORKERS", 4)
+
+# Навигация по меню: "edit" — редактировать сообщения экрана на месте,
+# "resend" — удалять старый экран и отправлять новый
+NAV_MODE = os.environ.get("NAV_MODE", "edit").lower()
+
+# Сообщения текущего экрана по чатам: лимит чатов (LRU), лимит сообщений
+# на чат, срок хранения и файл SQLite ("" — хранить только в памяти)
+TRACKED_MAX_CHATS = _env_int("TRACKED_MAX_CHATS", 50000)
+TRACKED_MAX_PER_CHAT = _env_int("TRACKED_MAX_PER_CHAT", 64)
+TRACKED_TTL_SECONDS = _env_int("TRACKED_TTL_SECONDS", 48 * 3600)
+TRACKED_DB_PATH = os.environ.get("TRACKED_DB_PATH", str(BASE_DIR / "data" / "tracked.db"))
+TRACKED_FLUSH_INTERVAL = _env_float("TRACKED_FLUSH_INTERVAL", 2.0)
+
+# Кэш проверки подписки: срок для «подписан» и «не подписан», размер
+SUBSCRIPTION_POSITIVE_TTL = _env_int("SUBSCRIPTION_POSITIVE_TTL", 600)
+SUBSCRIPTION_NEGATIVE_TTL = _env_int("SUBSCRIPTION_NEGATIVE_TTL", 60)
+SUBSCRIPTION_CACHE_SIZE = _env_int("SUBSCRIPTION_CACHE_SIZE", 100000)
+
+# chat_member не приходит, пока его явно не запросить
+ALLOWED_UPDATES = ["message", "callback_query", "chat_member"]
+
+# Массовая проверка подписки участников опроса: запросов в секунду и потоков
+SUBSCRIPTION_CHECK_RATE = _env_float("SUBSCRIPTION_CHECK_RATE", 100.0)
+SUBSCRIPTION_CHECK_WORKERS = _env_int("SUBSCRIPTION_CHECK_WORKERS", 16)
+
+# Живые результаты в сообщении опроса: включить и интервал правок (сек.)
+VOTES_LIVE_RESULTS = _env_flag("VOTES_LIVE_RESULTS", False)
+VOTES_LIVE_INTERVAL = _env_float("VOTES_LIVE_INTERVAL", 10.0)
+
+# Что делать с сообщением опроса при закрытии: "edit" — заменить итогами,
+# "post" — ответить итогами, "none" — только убрать кнопки
+VOTES_EXPIRY_ACTION = os.environ.get("VOTES_EXPIRY_ACTION", "edit").lower()
+
+# Архив закрытых опросов (для VOTES_BACKEND=json): votes.json хранит только открытые
+VOTES_ARCHIVE = _env_flag("VOTES_ARCHIVE", True)
+VOTES_ARCHIVE_DIR = os.environ.get("VOTES_ARCHIVE_DIR", str(BASE_DIR / "data" / "archive"))
+
+# Метрики Prometheus: GET http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_ENABLED = _env_flag("METRICS_ENABLED")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _env_int("METRICS_PORT", 9108)
+
+# Профилирование медленных обработчиков (profiling.py, команда /slow)
+PROFILE_ENABLED = _env_flag("PROFILE_ENABLED")
+PROFILE_THRESHOLD_MS = _env_int("PROFILE_THRESHOLD_MS", 1000)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", str(BASE_DIR / "data" / "profiles"))
+PROFILE_KEEP = _env_int("PROFILE_KEEP", 100)
+PROFILE_SAMPLE_INTERVAL_MS = _env_int("PROFILE_SAMPLE_INTERVAL_MS", 10)
+
+# Логи: запись в файл в отдельном потоке (logger.py)
+LOG_DIR = os.environ.get("LOG_DIR", "logs")
+LOG_JSON = _env_flag("LOG_JSON")
+# Доли для шумных событий: "album_photo=0.1,handler=0.05"
+LOG_SAMPLING = os.environ.get("LOG_SAMPLING", "")
+LOG_QUEUE_SIZE = _env_int("LOG_QUEUE_SIZE", 10000)
+LOG_BATCH_SIZE = _env_int("LOG_BATCH_SIZE", 256)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен — отдаём оригиналы
+    Image = None
+    ImageOps = None
+
+from config import (
+    DERIVATIVES_ENABLED, DERIVATIVES_DIR, DERIVATIVE_MAX_EDGE,
+    DERIVATIVE_QUALITY, DERIVATIVE_FORMAT, DERIVATIVE_WORKERS,
+)
+
+
+OUTPUT_DIR = Path(DERIVATIVES_DIR)
+MANIFEST_PATH = OUTPUT_DIR / "manifest.json"
+FORMAT_EXTS = {"jpeg": ".jpg", "webp": ".webp"}
+
+_lock = threading.Lock()
+_manifest = None
+
+
+# ========================================================================
+#          УМЕНЬШЕННЫЕ КОПИИ ФОТО ДЛЯ ОТПРАВКИ В TELEGRAM
+# ========================================================================
+#
+# Оригиналы с камеры Telegram всё равно пережимает, поэтому отправляем
+# копии с длинной стороной DERIVATIVE_MAX_EDGE. Имя копии — хэш содержимого
+# оригинала и параметров, оригиналы не изменяются. Манифест хранит размер
+# и mtime каждого оригинала, чтобы пересобирать только изменённые файлы.
+
+
+def is_available():
+    return DERIVATIVES_ENABLED and Image is not None
+
+
+def _load_manifest():
+    global _manifest
+    if _manifest is not None:
+        return _manifest
+    try:
+        with MANIFEST_PATH.open("r", encoding="utf-8") as f:
+            _manifest = json.load(f)
+    except Exception:
+        _manifest = {}
+    return _manifest
+
+
+def _save_manifest(manifest):
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".json.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=True, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def _render(source, output_dir, max_edge, quality, fmt):
+    """
+    Выполняется в отдельном процессе: хэширует оригинал и, если копии
+    с таким хэшем ещё нет, уменьшает и пережимает его.
+    """
+    with open(source, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data)
+    digest.update(f"|{max_edge}|{quality}|{fmt}".encode("ascii"))
+    name = digest.hexdigest()[:32] + FORMAT_EXTS[fmt]
+    target = Path(output_dir) / name
+    if target.exists():
+        return name
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        tmp_target = target.with_name(f"{name}.{os.getpid()}.tmp")
+        if fmt == "webp":
+            img.save(tmp_target, "WEBP", quality=quality, method=6)
+        else:
+            img.save(tmp_target, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_target, target)
+    return name
+
+
+def build_derivatives(sources, logger=None):
+    """
+    Пересобирает копии только для новых и изменённых оригиналов.
+    Работа распределяется по ядрам через пул процессов.
+    Записи и файлы для удалённых оригиналов убираются.
+    """
+    if not is_available():
+        if logger and DERIVATIVES_ENABLED:
+            logger.warning("Pillow не установлен — отправляем оригиналы фото")
+        return
+
+    started = time.monotonic()
+    fmt = DERIVATIVE_FORMAT if DERIVATIVE_FORMAT in FORMAT_EXTS else "jpeg"
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    with _lock:
+        manifest = dict(_load_manifest())
+
+    fresh = {}
+    stale = []
+    for source in sources:
+        key = str(source)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            continue
+        entry = manifest.get(key)
+        if (
+            entry
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+            and (OUTPUT_DIR / entry["name"]).exists()
+        ):
+            fresh[key] = entry
+        else:
+            stale.append((key, stat))
+
+    failed = 0
+    if stale:
+        with ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS or None) as executor:
+            futures = [
+                (key, stat, executor.submit(
+                    _render, key, str(OUTPUT_DIR), DERIVATIVE_MAX_EDGE, DERIVATIVE_QUALITY, fmt
+                ))
+                for key, stat in stale
+            ]
+            for key, stat, future in futures:
+                try:
+                    name = future.result()
+                except Exception as e:
+                    failed += 1
+                    if logger:
+                        logger.error(f"Не удалось подготовить копию {key}: {e}")
+                    continue
+                fresh[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "name": name}
+
+    used = {entry["name"] for entry in fresh.values()}
+    for path in OUTPUT_DIR.iterdir():
+        if path.name != MANIFEST_PATH.name and path.name not in used:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    with _lock:
+        global _manifest
+        _manifest = fresh
+        _save_manifest(fresh)
+
+    if logger:
+        logger.info(
+            f"Копии фото готовы за {time.monotonic() - started:.1f} с: "
+            f"пересобрано {len(stale) - failed}, без изменений {len(fresh) - len(stale) + failed}, "
+            f"с ошибками {failed}"
+        )
+
+
+def derivative_path(source):
+    """
+    Путь к уменьшенной копии, если она есть, иначе — сам оригинал.
+    """
+    if not is_available():
+        return source
+    with _lock:
+        entry = _load_manifest().get(str(source))
+    if not entry:
+        return source
+    return OUTPUT_DIR / entry["name"]
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from outbox import BULK
+from poll_locks import PollLockManager
+
+
+# ========================================================================
+#            ЖИВЫЕ РЕЗУЛЬТАТЫ В СООБЩЕНИИ С ОПРОСОМ
+# ========================================================================
+#
+# После подтверждения голоса опрос помечается «изменённым». Фоновый поток
+# правит сообщение опроса не чаще одного раза в interval секунд на опрос:
+# все голоса, пришедшие за это время, попадают в одну правку.
+# Сама правка идёт через очередь отправки (BULK), поэтому соблюдает
+# лимиты Telegram и уступает ответам пользователям.
+# Проверка «опрос открыт» и постановка правки в очередь выполняются под
+# блокировкой опроса (той же, что у закрытия), но ответа Telegram под ней
+# никто не ждёт. Правку, поставленную до закрытия, forget() дожидается,
+# поэтому итоговая правка всегда приходит последней.
+
+
+class LiveResultsUpdater:
+    def __init__(self, bot, storage, render, logger, interval=10.0, locks=None):
+        """
+        render(poll, counts) -> (text, markup) — текст и кнопки сообщения опроса.
+        locks — PollLockManager, которым опросы закрываются.
+        """
+        self.bot = bot
+        self.storage = storage
+        self.locks = locks or PollLockManager()
+        self.render = render
+        self.logger = logger
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._due = {}          # poll_id -> когда править
+        self._last_edit = {}    # poll_id -> время последней правки
+        self._last_counts = {}  # poll_id -> показанные счётчики
+        self._in_flight = {}    # poll_id -> Future отправленной правки
+        self.marked = 0
+        self.edits = 0
+        self.skipped = 0
+        self._thread = None
+
+    def mark(self, poll_id):
+        """
+        Голос в опросе изменился; правка будет не раньше, чем через
+        interval после предыдущей.
+        """
+        with self._cond:
+            self.marked += 1
+            if poll_id in self._due:
+                return
+            due = max(time.monotonic(), self._last_edit.get(poll_id, 0.0) + self.interval)
+            self._due[poll_id] = due
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-results", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def forget(self, poll_id):
+        """
+        Опрос закрыт: новых правок не будет, а уже отправленную дожидаемся,
+        чтобы она не пришла после итоговой. Вызывать после закрытия опроса
+        и без его блокировки.
+        """
+        with self._cond:
+            self._due.pop(poll_id, None)
+            self._last_edit.pop(poll_id, None)
+            self._last_counts.pop(poll_id, None)
+            future = self._in_flight.pop(poll_id, None)
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                pass  # ошибку уже записал _edit_done
+
+    def _take_due(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready = [poll_id for poll_id, due in self._due.items() if due <= now]
+                if ready:
+                    for poll_id in ready:
+                        del self._due[poll_id]
+                        self._last_edit[poll_id] = now
+                    return ready
+                timeout = min(self._due.values()) - now if self._due else None
+                self._cond.wait(timeout=timeout)
+
+    def _run(self):
+        while True:
+            for poll_id in self._take_due():
+                try:
+                    self._edit(poll_id)
+                except Exception as e:
+                    self.logger.warning(f"Не удалось обновить результаты опроса {poll_id}: {e}")
+
+    def _edit(self, poll_id):
+        with self.locks.hold(poll_id):
+            poll = self.storage.get_poll(poll_id)
+            if not poll or poll.get("closed") or not poll.get("message_id"):
+                return
+            counts = self.storage.get_tallies(poll_id)
+            if self._last_counts.get(poll_id) == counts:
+                self.skipped += 1
+                return
+            text, markup = self.render(poll, counts)
+            # wait=False: только ставим в очередь, сеть ждём уже без блокировки
+            future = self.bot.edit_message_text(
+                text, chat_id=poll["chat_id"], message_id=poll["message_id"],
+                reply_markup=markup, priority=BULK, wait=False
+            )
+            with self._cond:
+                self._last_counts[poll_id] = counts
+                self._in_flight[poll_id] = future
+                self.edits += 1
+        future.add_done_callback(lambda done: self._edit_done(poll_id, counts, done))
+
+    def _edit_done(self, poll_id, counts, future):
+        with self._cond:
+            if self._in_flight.get(poll_id) is future:
+                del self._in_flight[poll_id]
+            error = future.exception()
+            if error is not None and self._last_counts.get(poll_id) == counts:
+                # Правка не дошла — следующий голос покажет эти счётчики снова
+                del self._last_counts[poll_id]
+        if error is not None:
+            self.logger.warning(f"Не удалось обновить результаты опроса {poll_id}: {error}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._due),
+                "marked": self.marked,
+                "edits": self.edits,
+                "skipped": self.skipped,
+            }
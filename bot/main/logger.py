@@ -1,33 +1,199 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import random
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+from config import LOG_DIR, LOG_JSON, LOG_SAMPLING, LOG_QUEUE_SIZE, LOG_BATCH_SIZE
+
+
+# ========================================================================
+#            ЛОГИ: ОЧЕРЕДЬ, ОТДЕЛЬНЫЙ ПОТОК ЗАПИСИ, ПАЧКИ
+# ========================================================================
+#
+# Обработчики только кладут запись в очередь (QueueHandler). Форматирует
+# и пишет в файл один поток QueueListener: записи, накопившиеся в очереди,
+# уходят в файл одной записью, а ротация в полночь больше не держит
+# рабочие потоки. Если очередь переполнена, запись отбрасывается и
+# считается в logging_stats(), обработчик не ждёт.
+#
+# Структурные поля передаются через extra:
+#   logger.info("...", extra={"event": "callback", "user_id": ..., "chat_id": ...,
+#                             "action": ..., "duration_ms": ...})
+# LOG_JSON=1 — по одной JSON-записи на строку с этими полями.
+# LOG_SAMPLING="album_photo=0.1,handler=0.05" — для шумных событий
+# в лог попадает только указанная доля записей.
+
+STRUCTURED_FIELDS = ("event", "user_id", "chat_id", "action", "duration_ms")
+
+
+def _parse_sampling(value):
+    rates = {}
+    for item in (value or "").split(","):
+        event, _, rate = item.partition("=")
+        try:
+            rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # У логгера других обработчиков нет, поэтому запись не копируем;
+        # в потоке обработчика подставляем только args и traceback
+        if record.exc_info:
+            record.msg = self.format(record)
+            record.args = None
+            record.exc_info = None
+            record.exc_text = None
+        elif record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    # Traceback уже в тексте сообщения: QueueHandler.prepare() вписывает его туда
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BatchingFileHandler(TimedRotatingFileHandler):
+    """
+    Копит отформатированные строки и пишет их одним write + flush,
+    когда очередь логов опустела или набралось batch_size строк.
+    Вызывается только из потока QueueListener.
+    """
+
+    def __init__(self, filename, source, batch_size=256, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.source = source
+        self.batch_size = batch_size
+        self._pending = []
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self._write_pending()
+                self.doRollover()
+            self._pending.append(self.format(record))
+            if len(self._pending) >= self.batch_size or self.source.empty():
+                self._write_pending()
+        except Exception:
+            self.handleError(record)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write("\n".join(self._pending) + "\n")
+        self.stream.flush()
+        self._pending.clear()
+
+    def flush(self):
+        with self.lock:
+            self._write_pending()
+        super().flush()
+
+    def close(self):
+        with self.lock:
+            self._write_pending()
+        super().close()
+
+
+_pipeline = {}
 
 
 def setup_logger():
     # Создаём папку
-    os.makedirs("logs", exist_ok=True)
+    os.makedirs(LOG_DIR, exist_ok=True)
 
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s")
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
 
     # Логи сохраняются в файл: logs/bot.log
-    file_handler = TimedRotatingFileHandler(
-        filename="logs/bot.log",
+    file_handler = BatchingFileHandler(
+        os.path.join(LOG_DIR, "bot.log"),
+        log_queue,
+        batch_size=LOG_BATCH_SIZE,
         when="midnight",
         interval=1,
         backupCount=7,
-
         encoding="utf-8"
     )
-    file_handler.setFormatter(formatter)
+    if LOG_JSON:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s"))
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    sampling = SamplingFilter(_parse_sampling(LOG_SAMPLING))
+    queue_handler.addFilter(sampling)
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+
+    def stop():
+        # При выходе дописываем всё, что осталось в очереди и в пачке
+        listener.stop()
+        file_handler.close()
+
+    atexit.register(stop)
 
     logger = logging.getLogger("bot")
     logger.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
+    logger.addHandler(queue_handler)
 
     # Отключаем всплытие логов в корневой логгер
     logger.propagate = False
 
+    _pipeline.update(queue=log_queue, handler=queue_handler, sampling=sampling)
     return logger
 
 
+def logging_stats():
+    return {
+        "queued": _pipeline["queue"].qsize(),
+        "dropped": _pipeline["handler"].dropped,
+        "sampled_out": _pipeline["sampling"].sampled_out,
+    }
+
+
 logger = setup_logger()
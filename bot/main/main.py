@@ -1,355 +1,122 @@
 import telebot
-from telebot import types
-import traceback
-
-from works import get_categories, list_category_photos, CATEGORY_TITLES
-from subscription import is_subscribed
-from config import BOT_TOKEN, CHANNEL_ID, ADMIN_ID
-from logger import logger
-from texts import BUTTONS, MESSAGES, TITLES
+from telebot import apihelper
+
+from works import refresh_catalog, start_catalog_watcher
+from subscription import subscription_cache
+from config import (
+    BOT_TOKEN, CHANNEL_ID, ADMIN_ID,
+    WARMUP_ENABLED, STORAGE_CHAT_ID, WARMUP_CONCURRENCY,
+    CATALOG_REFRESH_SECONDS, BOT_NUM_THREADS, RUNTIME_MODE,
+    UPDATE_MODE, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_SET,
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_QUEUE_SIZE,
+    ALLOWED_UPDATES, TELEGRAM_API_URL,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+)
+from logger import logger, logging_stats
+from navigation import register_navigation_handlers
 from voting import register_voting_handlers
-
-
-bot = telebot.TeleBot(BOT_TOKEN)
-tracked_messages = {}
-register_voting_handlers(bot, logger, ADMIN_ID, CHANNEL_ID)
-
-
-# ========================================================================
-#                      УВЕДОМЛЕНИЯ ОБ ОШИБКАХ
-# ========================================================================
-
-def notify_user_error(chat_id, markup=None):
-    """
-    Сообщаем пользователю, что что-то пошло не так,
-    но без технических подробностей.
-    """
-    try:
-        send_tracked_message(
-            chat_id,
-            "⚠️  К сожалению, этот функционал временно недоступен. Мы уже работаем над исправлением.",
-            reply_markup=markup
-        )
-    except Exception:
-        # Даже если тут что-то упадёт — пользователя уже не спасаем
-        pass
-
-
-def notify_admin_error(user, action, exception_text):
-    """
-    Отправляем админу подробный отчёт об ошибке.
-    """
-    try:
-        text = (
-            "🔥 ОШИБКА У ПОЛЬЗОВАТЕЛЯ!\n\n"
-            f"👤 Пользователь: {user.id} (@{user.username})\n"
-            f"🧭 Действие: {action}\n\n"
-            f"📄 Ошибка:\n{exception_text}"
-        )
-        bot.send_message(ADMIN_ID, text)
-    except Exception:
-        # Если не смогли сообщить админу — просто молча игнорируем
-        pass
+from vote_storage import create_vote_storage
+from tracked_store import create_tracked_store
+from warmup import warm_up
+from outbox import ThrottledBot, create_outbox
+from webhook import WebhookServer
+from metrics import registry, instrument_telebot, MetricsServer
+from profiling import handler_profiler, register_profiling_handlers
+from router import CallbackRouter
+
+
+# У режима asyncio свой вход (async_main.main): потоковый TeleBot, очередь
+# отправки и обработчики опросов ниже в этом режиме создаваться не должны,
+# иначе планировщик закрытия опросов и пулы потоков запустятся дважды
+if __name__ == "__main__" and RUNTIME_MODE == "asyncio":
+    import async_main
+    async_main.main()
+    raise SystemExit
+
+
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL + "/bot{0}/{1}"
+instrument_telebot()
+
+# В режиме webhook обработчики выполняют рабочие потоки WebhookServer,
+# чтобы ограниченная очередь действительно сдерживала нагрузку
+bot = telebot.TeleBot(BOT_TOKEN, threaded=UPDATE_MODE != "webhook", num_threads=BOT_NUM_THREADS)
+# Все отправки сообщений идут через очередь с лимитами Telegram
+outbox = create_outbox(logger)
+api = ThrottledBot(bot, outbox)
+tracked_messages = create_tracked_store()
+vote_storage = create_vote_storage(logger)
+# Все нажатия кнопок, включая голосование, разбирает один роутер
+router = CallbackRouter(logger)
+register_voting_handlers(api, logger, ADMIN_ID, CHANNEL_ID, storage=vote_storage, router=router)
+register_profiling_handlers(api, logger, ADMIN_ID)
+# Экраны меню, /start и проверка подписки — общие с режимом asyncio
+register_navigation_handlers(api, logger, ADMIN_ID, CHANNEL_ID, tracked_messages, router)
+registry.add_collector("outbox", outbox.stats)
+registry.add_collector("tracked", tracked_messages.stats)
+registry.add_collector("subscription_cache", subscription_cache.stats)
+registry.add_collector("profiler", handler_profiler.stats)
+registry.add_collector("logging", logging_stats)
+registry.add_collector("router", router.stats)
 
 
 # ========================================================================
-#                          УТИЛИТЫ
+#                          ЗАПУСК БОТА
 # ========================================================================
 
-def send_photo(chat_id, path, caption=None, markup=None):
-    """
-    Отправляет ОДНО фото.
-    - Любые ошибки логируются
-    - Пользователь про техническую ошибку не узнаёт
-    """
-    try:
-        with open(path, "rb") as photo:
-            message = bot.send_photo(
-                chat_id,
-                photo,
-                caption=caption,
-                reply_markup=markup,
-                parse_mode="Markdown"
-            )
-        logger.info(f"Одиночное фото отправлено: {path} → chat({chat_id})")
-        return message
-
-    except FileNotFoundError:
-        logger.error(f"Фото не найдено: {path}")
-
-    except Exception as e:
-        logger.error(f"Ошибка при отправке фото {path}: {e}")
-    return None
-
-
-def create_buttons(*rows):
+def _abort_startup(text):
     """
-    Создаёт InlineKeyboardMarkup из нескольких строк кнопок.
-    rows: список списков кнопок.
+    Ошибка настройки: пишем в лог и завершаем процесс с ненулевым кодом.
+    Текст SystemExit попадает в stderr, то есть и в логи контейнера.
     """
-    markup = types.InlineKeyboardMarkup()
-    for row in rows:
-        markup.add(*row)
-    return markup
-
-
-def safe_delete_message(chat_id, message_id):
-    try:
-        bot.delete_message(chat_id, message_id)
-    except Exception:
-        pass
-
-
-def track_message(chat_id, message):
-    if message is None:
-        return
-    tracked_messages.setdefault(chat_id, []).append(message.message_id)
-
-
-def clear_tracked_messages(chat_id):
-    for message_id in tracked_messages.get(chat_id, []):
-        safe_delete_message(chat_id, message_id)
-    tracked_messages[chat_id] = []
-
-
-def send_tracked_message(chat_id, text, **kwargs):
-    message = bot.send_message(chat_id, text, **kwargs)
-    track_message(chat_id, message)
-    return message
-
-
-# ========================================================================
-#                           КОМАНДА /start
-# ========================================================================
-
-def send_main_menu(chat_id):
-    track_message(chat_id, send_photo(chat_id, "media/welcome/fistphoto.jpg"))
-
-    markup = create_buttons(
-        [types.InlineKeyboardButton(BUTTONS["ABOUT_ME"], callback_data="about_me")],
-        [types.InlineKeyboardButton(BUTTONS["FREE_MASTER"], callback_data="check")],
-        [types.InlineKeyboardButton(BUTTONS["MY_WORKS"], callback_data="my_job")]
-    )
-
-    send_tracked_message(chat_id, MESSAGES["START"], reply_markup=markup)
-
-
-@bot.message_handler(commands=['старт', 'start'])
-def on_start(message):
-    user = message.from_user
-    logger.info(f"/start от пользователя {user.id} @{user.username}")
-
-    clear_tracked_messages(message.chat.id)
-    send_main_menu(message.chat.id)
-
-
-# ========================================================================
-#                     ОБО МНЕ
-# ========================================================================
-
-def send_about_info(chat_id):
-    logger.info(f"Пользователь {chat_id} открыл 'Обо мне'")
-    track_message(chat_id, send_photo(chat_id, "media/welcome/Photo.jpg"))
-    markup = create_buttons(
-        [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_main")]
+    logger.error(text)
+    raise SystemExit(text)
+
+
+def run_webhook():
+    if not WEBHOOK_SECRET:
+        # Без секрета нельзя отличить Telegram от любого, кто знает адрес
+        _abort_startup("UPDATE_MODE=webhook, но WEBHOOK_SECRET не задан — webhook не запускается")
+    if WEBHOOK_SET:
+        if not WEBHOOK_URL:
+            _abort_startup("UPDATE_MODE=webhook, но WEBHOOK_URL не задан")
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
+
+    server = WebhookServer(
+        bot.process_new_updates,
+        WEBHOOK_SECRET,
+        logger,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        workers=BOT_NUM_THREADS,
     )
-    send_tracked_message(chat_id, MESSAGES["ABOUT_ME"], parse_mode="Markdown", reply_markup=markup)
-
-
-# ========================================================================
-#                     КАТЕГОРИИ РАБОТ
-# ========================================================================
-
-def send_categories(chat_id):
-    logger.info(f"Пользователь {chat_id} открыл список категорий")
-
-    categories = get_categories()
-    markup = types.InlineKeyboardMarkup()
-
-    for i in range(0, len(categories), 2):
-        left_key, left_title = categories[i]
-        row = [types.InlineKeyboardButton(left_title, callback_data=f"cat_{left_key}")]
-        if i + 1 < len(categories):
-            right_key, right_title = categories[i + 1]
-            row.append(types.InlineKeyboardButton(right_title, callback_data=f"cat_{right_key}"))
-        markup.add(*row)
+    registry.add_collector("webhook", server.stats)
+    logger.info("Бот запущен в режиме webhook ✔")
+    server.serve_forever()
 
-    markup.add(types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_main"))
 
-    send_tracked_message(chat_id, TITLES["CHOOSE_CATEGORY"], reply_markup=markup)
-
-
-# ========================================================================
-#                     ПРОВЕРКА ПОДПИСКИ
-# ========================================================================
-
-def send_subscription_check(chat_id):
-    logger.info(f"Пользователь {chat_id} открыл раздел проверки подписки")
-
-    markup = create_buttons(
-        [types.InlineKeyboardButton(BUTTONS["CHANNEL"], url="https://t.me/dollminiature")],
-        [types.InlineKeyboardButton(BUTTONS["CHECK_SUB"], callback_data="check_subscription")],
-        [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_main")]
-    )
-
-    send_tracked_message(chat_id, MESSAGES["SUBSCRIBE"], reply_markup=markup)
-
-
-# ========================================================================
-#                     ОТПРАВКА ГРУППЫ ФОТО (АЛЬБОМ)
-# ========================================================================
-
-def send_category_album(chat_id, category):
-    """
-    Отправляет все фото выбранной категории в виде альбома.
-    Если тут что-то ломается — ошибка улетит наверх (raise),
-    и её поймает общий try/except в callbacks().
-    """
-    logger.info(f"Пользователь {chat_id} открыл категорию '{category}'")
-
-    works = list_category_photos(category)
-    if not works:
-        logger.warning(f"Категория '{category}' пустая или не найдена")
-        return
-
-    media = []
-    open_files = []
-
-    try:
-        for path_obj in works:
-            path = str(path_obj)
-
-            try:
-                f = open(path, "rb")
-                open_files.append(f)
-                media.append(types.InputMediaPhoto(f))
-                logger.info(f"Добавлено фото в альбом: {path}")
-            except FileNotFoundError:
-                logger.error(f"Файл не найден: {path}")
-            except Exception as e:
-                logger.error(f"Ошибка при чтении файла {path}: {e}")
-
-        if not media:
-            logger.warning(f"В категории '{category}' нет доступных фото")
-            return
-
-        messages = bot.send_media_group(chat_id, media)
-        for message in messages:
-            track_message(chat_id, message)
-
-        display_name = CATEGORY_TITLES.get(category, category)
-        send_tracked_message(
-            chat_id,
-            TITLES["CATEGORY_HEADER"].format(name=display_name),
-            parse_mode="Markdown",
-            reply_markup=create_buttons(
-                [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_categories")]
-            )
-        )
-
-    except Exception as e:
-        logger.error(f"Ошибка при отправке альбома категории '{category}': {e}")
-        raise   # <– ключевое: проброс ошибки наверх
-
-    finally:
-        for f in open_files:
-            try:
-                f.close()
-            except Exception:
-                pass
-
-
-# ========================================================================
-#                        ОБРАБОТЧИК CALLBACK
-# ========================================================================
-
-@bot.callback_query_handler(func=lambda call: True)
-def callbacks(call):
-    """
-    Обрабатывает ВСЕ нажатия кнопок.
-    При любой непойманной ошибке:
-      - пользователь увидит мягкое сообщение
-      - админ получит отчёт
-      - логгер запишет traceback
-    """
+if __name__ == "__main__":
+    if METRICS_ENABLED:
+        MetricsServer(logger, host=METRICS_HOST, port=METRICS_PORT).start()
 
-    user = call.from_user
-    data = call.data
+    refresh_catalog(logger=logger)
+    if CATALOG_REFRESH_SECONDS > 0:
+        start_catalog_watcher(CATALOG_REFRESH_SECONDS, logger=logger)
 
-    logger.info(f"Callback '{data}' от пользователя {user.id} @{user.username}")
+    if WARMUP_ENABLED:
+        if STORAGE_CHAT_ID:
+            warm_up(bot, STORAGE_CHAT_ID, logger, concurrency=WARMUP_CONCURRENCY)
+        else:
+            logger.warning("Прогрев включён, но STORAGE_CHAT_ID не задан — пропускаем")
 
     try:
-        if data.startswith("vote:"):
-            return
-        clear_tracked_messages(call.message.chat.id)
-        safe_delete_message(call.message.chat.id, call.message.message_id)
-
-        if data == "about_me":
-            send_about_info(call.message.chat.id)
-
-        elif data == "my_job":
-            send_categories(call.message.chat.id)
-
-        elif data == "check":
-            send_subscription_check(call.message.chat.id)
-
-        elif data == "check_subscription":
-            if is_subscribed(bot, CHANNEL_ID, user.id):
-                logger.info(f"Подписка подтверждена: {user.id}")
-
-                markup = create_buttons(
-                    [types.InlineKeyboardButton(
-                        BUTTONS["MASTERCLASS_LINK"],
-                        url="https://disk.yandex.ru/i/5SeUgQ1cjjok0Q"
-                    )],
-                    [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_subscribe")]
-                )
-                send_tracked_message(call.message.chat.id, MESSAGES["THANKS_FOR_SUB"], reply_markup=markup)
-            else:
-                logger.warning(f"Пользователь {user.id} НЕ подписан на канал")
-                markup = create_buttons(
-                    [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_subscribe")]
-                )
-                send_tracked_message(call.message.chat.id, MESSAGES["NOT_SUBSCRIBED"], reply_markup=markup)
-
-        elif data == "back_main":
-            send_main_menu(call.message.chat.id)
-
-        elif data == "back_categories":
-            send_categories(call.message.chat.id)
-
-        elif data == "back_subscribe":
-            send_subscription_check(call.message.chat.id)
-
-        elif data.startswith("cat_"):
-            category = data[4:]
-            send_category_album(call.message.chat.id, category)
-
-    except Exception as e:
-        # 1. Сообщаем пользователю
-        fallback_markup = None
-        if data.startswith("cat_"):
-            fallback_markup = create_buttons(
-                [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_categories")]
-            )
+        if UPDATE_MODE == "webhook":
+            run_webhook()
         else:
-            fallback_markup = create_buttons(
-                [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_main")]
-            )
-        notify_user_error(call.message.chat.id, markup=fallback_markup)
-
-        # 2. Пишем в лог-файл
-        logger.exception(f"Ошибка в callback '{data}' для пользователя {user.id}: {e}")
-
-        # 3. Шлём админу подробный отчёт
-        full_error = traceback.format_exc()
-        notify_admin_error(user, data, full_error)
-
-
-# ========================================================================
-#                          ЗАПУСК БОТА
-# ========================================================================
-
-if __name__ == "__main__":
-    logger.info("Бот запущен ✔")
-    bot.polling(none_stop=True)
+            logger.info("Бот запущен ✔")
+            bot.polling(none_stop=True, allowed_updates=ALLOWED_UPDATES)
+    finally:
+        vote_storage.close()
+        tracked_messages.close()
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from config import FILE_ID_CACHE_PATH
+
+
+CACHE_PATH = Path(FILE_ID_CACHE_PATH)
+
+_lock = threading.Lock()
+_entries = None
+_keys = {}
+
+
+# ========================================================================
+#                  КЭШ file_id ДЛЯ ОТПРАВЛЕННЫХ ФОТО
+# ========================================================================
+#
+# Telegram возвращает file_id для каждого загруженного фото. Повторная
+# отправка по file_id — это один маленький запрос без загрузки байтов.
+# Ключ кэша: путь + размер + mtime, чтобы заменённый файл загрузился заново.
+
+
+def _load():
+    global _entries
+    if _entries is not None:
+        return _entries
+    try:
+        with CACHE_PATH.open("r", encoding="utf-8") as f:
+            _entries = json.load(f)
+    except Exception:
+        _entries = {}
+    return _entries
+
+
+def _save(entries):
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = CACHE_PATH.with_suffix(CACHE_PATH.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=True)
+    os.replace(tmp_path, CACHE_PATH)
+
+
+def cache_key(path):
+    """
+    Ключ файла: путь + размер + время изменения.
+    Если файла нет — None (кэш не используется).
+    Ключ запоминается до reset_keys(), чтобы не делать stat на каждую отправку:
+    индекс работ (works.py) сбрасывает ключи, когда меняется любое фото.
+    """
+    key = _keys.get(path)
+    if key is not None:
+        return key
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+    _keys[path] = key
+    return key
+
+
+def reset_keys():
+    """
+    Сбрасывает запомненные ключи (вызывается при обновлении индекса работ).
+    """
+    _keys.clear()
+
+
+def prune(paths):
+    """
+    Оставляет в кэше только текущие версии фото из paths (вызывается при
+    обновлении индекса работ): записи удалённых, заменённых и
+    перезаписанных на месте фото больше не понадобятся. Возвращает,
+    сколько записей удалено.
+    """
+    reset_keys()
+    current = {cache_key(str(path)) for path in paths}
+    with _lock:
+        entries = _load()
+        stale = [key for key in entries if key not in current]
+        for key in stale:
+            del entries[key]
+        if stale:
+            _save(entries)
+    return len(stale)
+
+
+def get_file_id(path):
+    key = cache_key(path)
+    if key is None:
+        return None
+    with _lock:
+        return _load().get(key)
+
+
+def remember_file_id(path, file_id):
+    """
+    Запоминает file_id для файла и сразу сохраняет кэш на диск.
+    Старые записи для того же пути (до изменения файла) удаляются.
+    """
+    key = cache_key(path)
+    if key is None or not file_id:
+        return
+    prefix = f"{path}|"
+    with _lock:
+        entries = _load()
+        if entries.get(key) == file_id:
+            return
+        for old_key in [k for k in entries if k.startswith(prefix)]:
+            del entries[old_key]
+        entries[key] = file_id
+        _save(entries)
+
+
+def forget_file_id(path):
+    """
+    Удаляет file_id (например, если Telegram его больше не принимает).
+    """
+    key = cache_key(path)
+    if key is None:
+        return
+    with _lock:
+        entries = _load()
+        if entries.pop(key, None) is not None:
+            _save(entries)
+
+
+def photo_file_id(message):
+    """
+    file_id самого большого варианта фото из ответа Telegram.
+    """
+    photos = getattr(message, "photo", None) if message is not None else None
+    if not photos:
+        return None
+    return photos[-1].file_id
@@ -0,0 +1,310 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logger import logger
+from profiling import handler_profiler
+
+
+# ========================================================================
+#                МЕТРИКИ В ФОРМАТЕ PROMETHEUS
+# ========================================================================
+#
+# Гистограммы времени обработчиков и запросов к Bot API, счётчики ошибок,
+# повторов и удалений, плюс текущие stats() компонентов (очередь отправки,
+# кэши, блокировки опросов) в виде gauge. Запись — несколько операций под
+# своим lock'ом, поэтому метрики собираются всегда; HTTP-сервер с
+# /metrics запускается только при METRICS_ENABLED.
+# Отдельная зависимость (prometheus_client) не нужна: текстовый формат
+# экспозиции простой.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _labels(self.labels, label_values, extra=[("le", _number(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {round(total, 6)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, component, stats):
+        """
+        stats() -> dict чисел; каждое поле станет gauge bot_<component>_<поле>.
+        Повторная регистрация компонента заменяет прежнюю.
+        """
+        with self._lock:
+            self._collectors[component] = stats
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = sorted(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for component, stats in collectors:
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"bot_{component}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.register(Histogram(
+    "bot_handler_seconds", "Время обработки апдейта обработчиком", ("handler",)
+))
+HANDLER_ERRORS = registry.register(Counter(
+    "bot_handler_errors_total", "Необработанные исключения в обработчиках", ("handler",)
+))
+API_SECONDS = registry.register(Histogram(
+    "bot_api_request_seconds", "Время запроса к Bot API", ("method",)
+))
+API_ERRORS = registry.register(Counter(
+    "bot_api_errors_total", "Ошибки запросов к Bot API по коду (network — нет ответа)", ("method", "code")
+))
+API_RETRIES = registry.register(Counter(
+    "bot_api_retries_total", "Повторы отправки из очереди после 429", ("method",)
+))
+DELETED_MESSAGES = registry.register(Counter(
+    "bot_deleted_messages_total", "Удаление старых сообщений", ("result",)
+))
+
+
+# ========================================================================
+#                       ОБРАБОТЧИКИ
+# ========================================================================
+
+@contextmanager
+def track_handler(name):
+    """
+    Время обработчика в bot_handler_seconds; исключение считается
+    в bot_handler_errors_total и пробрасывается дальше.
+    Медленный обработчик попадает в профилировщик (profiling.py).
+    В лог пишется запись event=handler с duration_ms (шумная — её можно
+    проредить через LOG_SAMPLING).
+    """
+    started = time.perf_counter()
+    profile = handler_profiler.begin(name)
+    try:
+        yield
+    except Exception:
+        HANDLER_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        HANDLER_SECONDS.observe(elapsed, name)
+        handler_profiler.end(profile)
+        duration_ms = round(elapsed * 1000, 1)
+        logger.info(
+            f"{name} обработан за {duration_ms} мс",
+            extra={"event": "handler", "action": name, "duration_ms": duration_ms},
+        )
+
+
+def timed(name):
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(*args, **kwargs):
+                with track_handler(name):
+                    return await handler(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            with track_handler(name):
+                return handler(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ========================================================================
+#                       ЗАПРОСЫ К BOT API
+# ========================================================================
+
+def _error_code(exc):
+    code = getattr(exc, "error_code", None)
+    return str(code) if code is not None else "network"
+
+
+def instrument_telebot():
+    """
+    Оборачивает apihelper._make_request: через него идут все методы TeleBot.
+    """
+    from telebot import apihelper
+
+    make_request = apihelper._make_request
+    if getattr(make_request, "_metrics", False):
+        return
+
+    def instrumented(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return make_request(token, method_name, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(method_name, _error_code(e))
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, method_name)
+
+    instrumented._metrics = True
+    apihelper._make_request = instrumented
+
+
+def instrument_async_telebot():
+    """
+    То же для AsyncTeleBot: оборачивается asyncio_helper._process_request.
+    """
+    from telebot import asyncio_helper
+
+    process_request = asyncio_helper._process_request
+    if getattr(process_request, "_metrics", False):
+        return
+
+    async def instrumented(token, url, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await process_request(token, url, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(url, _error_code(e))
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, url)
+
+    instrumented._metrics = True
+    asyncio_helper._process_request = instrumented
+
+
+# ========================================================================
+#                       HTTP-СЕРВЕР /metrics
+# ========================================================================
+
+class MetricsServer:
+    def __init__(self, logger, host="127.0.0.1", port=9108, path="/metrics"):
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.path = path
+        self._httpd = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != server.path:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="metrics", daemon=True).start()
+        self.logger.info(f"Метрики: http://{self.host}:{self.port}{self.path}")
+        return self
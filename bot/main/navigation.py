@@ -0,0 +1,523 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+from config import CLEANUP_WORKERS, NAV_MODE
+from media_cache import get_file_id, remember_file_id, forget_file_id, photo_file_id
+from metrics import timed, DELETED_MESSAGES
+from outbox import BULK
+from profiling import phase
+from screens import (
+    back_markup, error_fallback_markup,
+    main_menu_screen, about_screen, categories_screen,
+    subscription_screen, subscribed_screen, not_subscribed_screen,
+)
+from subscription import is_subscribed, is_channel_update, apply_chat_member_update
+from texts import TITLES
+from works import get_categories, list_category_photos, CATEGORY_TITLES
+
+
+DELETE_BATCH_SIZE = 100
+
+
+# ========================================================================
+#                  ЭКРАНЫ МЕНЮ И НАВИГАЦИЯ ПО НИМ
+# ========================================================================
+#
+# Общие для обоих режимов запуска: /start, «Обо мне», категории и
+# альбомы, проверка подписки, ошибки в callback'ах. Обработчики
+# синхронные и вызывают только bot — потоковый режим передаёт сюда
+# ThrottledBot над TeleBot, режим asyncio — то же поверх SyncBotBridge.
+# Поэтому очередь отправки, редактирование экрана на месте и
+# ограниченное хранилище сообщений экрана работают в обоих режимах.
+
+
+def _is_not_modified(exc):
+    return isinstance(exc, ApiTelegramException) and "message is not modified" in str(exc)
+
+
+def _can_edit(stale, parts):
+    if not stale:
+        return False
+    return all(
+        kind == part["kind"] and kind in ("photo", "text")
+        for (_message_id, kind), part in zip(stale, parts)
+    )
+
+
+def register_navigation_handlers(bot, logger, admin_id, channel_id, tracked, router):
+    """
+    tracked — TrackedMessageStore сообщений текущего экрана;
+    router — общий CallbackRouter бота: сюда добавляются маршруты экранов,
+    общий обработчик ошибок и единственный обработчик callback_query.
+    """
+    cleanup_executor = ThreadPoolExecutor(max_workers=CLEANUP_WORKERS, thread_name_prefix="cleanup")
+
+    # ====================================================================
+    #                      УВЕДОМЛЕНИЯ ОБ ОШИБКАХ
+    # ====================================================================
+
+    def notify_user_error(chat_id, markup=None):
+        """
+        Сообщаем пользователю, что что-то пошло не так,
+        но без технических подробностей.
+        """
+        try:
+            send_tracked_message(
+                chat_id,
+                "⚠️  К сожалению, этот функционал временно недоступен. Мы уже работаем над исправлением.",
+                reply_markup=markup
+            )
+        except Exception:
+            # Даже если тут что-то упадёт — пользователя уже не спасаем
+            pass
+
+    def notify_admin_error(user, action, exception_text):
+        """
+        Отправляем админу подробный отчёт об ошибке.
+        """
+        try:
+            text = (
+                "🔥 ОШИБКА У ПОЛЬЗОВАТЕЛЯ!\n\n"
+                f"👤 Пользователь: {user.id} (@{user.username})\n"
+                f"🧭 Действие: {action}\n\n"
+                f"📄 Ошибка:\n{exception_text}"
+            )
+            bot.send_message(admin_id, text, priority=BULK, wait=False)
+        except Exception as e:
+            # Если не смогли сообщить админу — только пишем в лог
+            logger.error(f"Не удалось отправить отчёт админу: {e}")
+
+    # ====================================================================
+    #                              УТИЛИТЫ
+    # ====================================================================
+
+    def send_photo(chat_id, path, caption=None, markup=None, parse_mode="Markdown"):
+        """
+        Отправляет ОДНО фото.
+        - Если фото уже загружалось — отправляем по file_id (без загрузки байтов)
+        - Любые ошибки логируются
+        - Пользователь про техническую ошибку не узнаёт
+        """
+        try:
+            file_id = get_file_id(path)
+            if file_id:
+                try:
+                    message = bot.send_photo(
+                        chat_id,
+                        file_id,
+                        caption=caption,
+                        reply_markup=markup,
+                        parse_mode=parse_mode
+                    )
+                    logger.info(
+                        f"Одиночное фото отправлено по file_id: {path} → chat({chat_id})",
+                        extra={"event": "photo_sent", "chat_id": chat_id},
+                    )
+                    return message
+                except ApiTelegramException as e:
+                    if e.error_code != 400:
+                        raise
+                    # file_id больше не действителен — загружаем файл заново
+                    logger.warning(f"file_id для {path} отклонён Telegram: {e}")
+                    forget_file_id(path)
+
+            with open(path, "rb") as photo:
+                message = bot.send_photo(
+                    chat_id,
+                    photo,
+                    caption=caption,
+                    reply_markup=markup,
+                    parse_mode=parse_mode
+                )
+            remember_file_id(path, photo_file_id(message))
+            logger.info(
+                f"Одиночное фото отправлено: {path} → chat({chat_id})",
+                extra={"event": "photo_sent", "chat_id": chat_id},
+            )
+            return message
+
+        except FileNotFoundError:
+            logger.error(f"Фото не найдено: {path}")
+
+        except Exception as e:
+            logger.error(f"Ошибка при отправке фото {path}: {e}")
+        return None
+
+    def safe_delete_message(chat_id, message_id):
+        try:
+            bot.delete_message(chat_id, message_id)
+            DELETED_MESSAGES.inc("ok")
+        except Exception:
+            DELETED_MESSAGES.inc("failed")
+
+    def delete_messages(chat_id, message_ids):
+        """
+        Удаляет сообщения пачками через deleteMessages (до 100 id за запрос).
+        Если пакетное удаление недоступно — удаляем по одному, параллельно.
+        """
+        for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+            chunk = message_ids[i:i + DELETE_BATCH_SIZE]
+            try:
+                bot.delete_messages(chat_id, chunk)
+                DELETED_MESSAGES.inc("ok", amount=len(chunk))
+            except Exception as e:
+                logger.warning(f"deleteMessages не сработал для chat({chat_id}): {e}")
+                for message_id in chunk:
+                    cleanup_executor.submit(safe_delete_message, chat_id, message_id)
+
+    def delete_messages_later(chat_id, message_ids):
+        """
+        Удаление в фоне: новый экран уже отправлен, пользователь не ждёт.
+        """
+        if message_ids:
+            cleanup_executor.submit(delete_messages, chat_id, list(message_ids))
+
+    def track_message(chat_id, message, kind=None):
+        """
+        Запоминает сообщение экрана вместе с его видом
+        ("photo", "text" или "album"), чтобы потом отредактировать или удалить.
+        """
+        if message is None:
+            return
+        tracked.add(chat_id, message.message_id, kind or message.content_type)
+
+    def take_tracked_messages(chat_id):
+        """
+        Забирает отслеживаемые сообщения чата: список (message_id, вид).
+        """
+        return tracked.take(chat_id)
+
+    def delete_stale_later(chat_id, stale):
+        """
+        Удаляет в фоне старые сообщения, которые не вошли в новый экран.
+        """
+        current = tracked.ids(chat_id)
+        delete_messages_later(chat_id, [message_id for message_id, _kind in stale if message_id not in current])
+
+    def send_tracked_message(chat_id, text, **kwargs):
+        message = bot.send_message(chat_id, text, **kwargs)
+        track_message(chat_id, message)
+        return message
+
+    # ====================================================================
+    #             ПОКАЗ ЭКРАНА: РЕДАКТИРОВАНИЕ ИЛИ ОТПРАВКА
+    # ====================================================================
+
+    def _send_part(chat_id, part):
+        if part["kind"] == "photo":
+            message = send_photo(
+                chat_id, part["path"], caption=part["caption"],
+                markup=part["markup"], parse_mode=part["parse_mode"]
+            )
+            if message is not None or not (part["caption"] or part["markup"]):
+                track_message(chat_id, message)
+                return
+            # Фото не отправилось — показываем хотя бы текст и кнопки
+            send_tracked_message(
+                chat_id, part["caption"] or "⬇️", reply_markup=part["markup"], parse_mode=part["parse_mode"]
+            )
+            return
+
+        send_tracked_message(chat_id, part["text"], reply_markup=part["markup"], parse_mode=part["parse_mode"])
+
+    def _edit_part(chat_id, message_id, part):
+        try:
+            if part["kind"] == "text":
+                bot.edit_message_text(
+                    part["text"], chat_id=chat_id, message_id=message_id,
+                    reply_markup=part["markup"], parse_mode=part["parse_mode"]
+                )
+                return
+
+            path = part["path"]
+            file_id = get_file_id(path)
+            if file_id:
+                media = types.InputMediaPhoto(file_id, caption=part["caption"], parse_mode=part["parse_mode"])
+                bot.edit_message_media(media, chat_id=chat_id, message_id=message_id, reply_markup=part["markup"])
+                return
+            with open(path, "rb") as photo:
+                media = types.InputMediaPhoto(photo, caption=part["caption"], parse_mode=part["parse_mode"])
+                message = bot.edit_message_media(
+                    media, chat_id=chat_id, message_id=message_id, reply_markup=part["markup"]
+                )
+            remember_file_id(path, photo_file_id(message))
+        except ApiTelegramException as e:
+            if not _is_not_modified(e):
+                raise
+
+    def show_screen(chat_id, parts, stale=()):
+        """
+        Показывает экран.
+        NAV_MODE=edit: если старые сообщения того же вида (фото → фото,
+        текст → текст), они редактируются на месте, недостающие части
+        досылаются. Иначе экран отправляется заново.
+        Лишние старые сообщения удаляет вызывающий код (delete_stale_later).
+        """
+        stale = list(stale)
+        if NAV_MODE == "edit" and _can_edit(stale, parts):
+            try:
+                with phase("edit_screen"):
+                    for (message_id, kind), part in zip(stale, parts):
+                        _edit_part(chat_id, message_id, part)
+                        tracked.add(chat_id, message_id, kind)
+                    for part in parts[len(stale):]:
+                        _send_part(chat_id, part)
+                return
+            except Exception as e:
+                logger.warning(f"Не удалось отредактировать экран в chat({chat_id}), отправляем заново: {e}")
+                take_tracked_messages(chat_id)
+
+        with phase("send_screen"):
+            for part in parts:
+                _send_part(chat_id, part)
+
+    # ====================================================================
+    #                           КОМАНДА /start
+    # ====================================================================
+
+    def send_main_menu(chat_id, stale=()):
+        show_screen(chat_id, main_menu_screen(), stale)
+
+    @bot.message_handler(commands=['старт', 'start'])
+    @timed("/start")
+    def on_start(message):
+        user = message.from_user
+        logger.info(
+            f"/start от пользователя {user.id} @{user.username}",
+            extra={"event": "start", "user_id": user.id, "chat_id": message.chat.id, "action": "/start"},
+        )
+
+        # Новое меню отправляется под командой, старое удаляется
+        stale = take_tracked_messages(message.chat.id)
+        try:
+            send_main_menu(message.chat.id)
+        finally:
+            delete_stale_later(message.chat.id, stale)
+
+    # ====================================================================
+    #                     ОБО МНЕ, КАТЕГОРИИ, ПОДПИСКА
+    # ====================================================================
+
+    def send_about_info(chat_id, stale=()):
+        logger.info(f"Пользователь {chat_id} открыл 'Обо мне'")
+        show_screen(chat_id, about_screen(), stale)
+
+    def send_categories(chat_id, stale=()):
+        logger.info(f"Пользователь {chat_id} открыл список категорий")
+        show_screen(chat_id, categories_screen(get_categories()), stale)
+
+    def send_subscription_check(chat_id, stale=()):
+        logger.info(f"Пользователь {chat_id} открыл раздел проверки подписки")
+        show_screen(chat_id, subscription_screen(), stale)
+
+    @bot.chat_member_handler(func=lambda update: is_channel_update(update, channel_id))
+    @timed("chat_member")
+    def on_channel_member(update):
+        apply_chat_member_update(update, channel_id)
+        logger.info(
+            f"Канал: пользователь {update.new_chat_member.user.id} → {update.new_chat_member.status}"
+        )
+
+    def send_subscription_result(chat_id, user, stale=()):
+        with phase("get_chat_member"):
+            subscribed = is_subscribed(bot, channel_id, user.id)
+        if subscribed:
+            logger.info(f"Подписка подтверждена: {user.id}")
+            show_screen(chat_id, subscribed_screen(), stale)
+        else:
+            logger.warning(f"Пользователь {user.id} НЕ подписан на канал")
+            show_screen(chat_id, not_subscribed_screen(), stale)
+
+    # ====================================================================
+    #                   ОТПРАВКА ГРУППЫ ФОТО (АЛЬБОМ)
+    # ====================================================================
+
+    def send_category_album(chat_id, category):
+        """
+        Отправляет все фото выбранной категории в виде альбома.
+        Если тут что-то ломается — ошибка улетит наверх (raise),
+        и её поймает общий обработчик ошибок роутера (on_callback_error).
+        """
+        logger.info(f"Пользователь {chat_id} открыл категорию '{category}'")
+
+        works = list_category_photos(category)
+        if not works:
+            logger.warning(f"Категория '{category}' пустая или не найдена")
+            return
+
+        try:
+            try:
+                messages, paths, cached = _send_album(chat_id, works, use_cache=True)
+            except ApiTelegramException as e:
+                if e.error_code != 400 or not any(get_file_id(str(p)) for p in works):
+                    raise
+                # Какой-то из file_id устарел — сбрасываем кэш категории и грузим файлы заново
+                logger.warning(f"Альбом категории '{category}' по file_id отклонён Telegram: {e}")
+                for path_obj in works:
+                    forget_file_id(str(path_obj))
+                messages, paths, cached = _send_album(chat_id, works, use_cache=False)
+
+            if not messages:
+                logger.warning(f"В категории '{category}' нет доступных фото")
+                return
+
+            for path, message, was_cached in zip(paths, messages, cached):
+                if not was_cached:
+                    remember_file_id(path, photo_file_id(message))
+            for message in messages:
+                track_message(chat_id, message, kind="album")
+
+            display_name = CATEGORY_TITLES.get(category, category)
+            send_tracked_message(
+                chat_id,
+                TITLES["CATEGORY_HEADER"].format(name=display_name),
+                parse_mode="Markdown",
+                reply_markup=back_markup("back_categories")
+            )
+
+        except Exception as e:
+            logger.error(f"Ошибка при отправке альбома категории '{category}': {e}")
+            raise   # <– ключевое: проброс ошибки наверх
+
+    def _send_album(chat_id, works, use_cache):
+        """
+        Собирает и отправляет альбом.
+        Фото с известным file_id не загружаются повторно.
+        Возвращает (сообщения, пути, признаки «из кэша») в одном порядке.
+        """
+        media = []
+        paths = []
+        cached = []
+        open_files = []
+
+        try:
+            for path_obj in works:
+                path = str(path_obj)
+
+                file_id = get_file_id(path) if use_cache else None
+                if file_id:
+                    media.append(types.InputMediaPhoto(file_id))
+                    paths.append(path)
+                    cached.append(True)
+                    logger.info(
+                        f"Добавлено фото в альбом по file_id: {path}",
+                        extra={"event": "album_photo", "chat_id": chat_id},
+                    )
+                    continue
+
+                try:
+                    f = open(path, "rb")
+                    open_files.append(f)
+                    media.append(types.InputMediaPhoto(f))
+                    paths.append(path)
+                    cached.append(False)
+                    logger.info(
+                        f"Добавлено фото в альбом: {path}",
+                        extra={"event": "album_photo", "chat_id": chat_id},
+                    )
+                except FileNotFoundError:
+                    logger.error(f"Файл не найден: {path}")
+                except Exception as e:
+                    logger.error(f"Ошибка при чтении файла {path}: {e}")
+
+            if not media:
+                return [], [], []
+
+            with phase("send_media_group"):
+                messages = bot.send_media_group(chat_id, media)
+            return messages, paths, cached
+
+        finally:
+            for f in open_files:
+                try:
+                    f.close()
+                except Exception:
+                    pass
+
+    # ====================================================================
+    #                        ОБРАБОТЧИК CALLBACK
+    # ====================================================================
+
+    def screen_route(*data, prefix=None):
+        """
+        Регистрирует show(call, stale) в роутере. Сообщения текущего экрана
+        (stale) по возможности редактируются на месте, остальные удаляются
+        в фоне после показа нового экрана.
+        """
+        def decorator(show):
+            def handler(call):
+                chat_id = call.message.chat.id
+                stale = take_tracked_messages(chat_id)
+                if call.message.message_id not in {message_id for message_id, _kind in stale}:
+                    stale.append((call.message.message_id, call.message.content_type))
+                try:
+                    show(call, stale)
+                finally:
+                    with phase("schedule_deletes"):
+                        delete_stale_later(chat_id, stale)
+
+            router.route(*data, prefix=prefix)(handler)
+            return show
+        return decorator
+
+    @screen_route("about_me")
+    def on_about(call, stale):
+        send_about_info(call.message.chat.id, stale)
+
+    @screen_route("my_job", "back_categories")
+    def on_categories(call, stale):
+        send_categories(call.message.chat.id, stale)
+
+    @screen_route("check", "back_subscribe")
+    def on_subscription_check(call, stale):
+        send_subscription_check(call.message.chat.id, stale)
+
+    @screen_route("check_subscription")
+    def on_subscription_result(call, stale):
+        send_subscription_result(call.message.chat.id, call.from_user, stale)
+
+    @screen_route("back_main")
+    def on_back_main(call, stale):
+        send_main_menu(call.message.chat.id, stale)
+
+    @screen_route(prefix="cat_")
+    def on_category(call, stale):
+        # Альбом нельзя получить редактированием — отправляется заново
+        send_category_album(call.message.chat.id, call.data[len("cat_"):])
+
+    @router.error_handler
+    def on_callback_error(call, exc):
+        """
+        При любой непойманной ошибке в маршруте:
+          - пользователь увидит мягкое сообщение
+          - админ получит отчёт
+          - логгер запишет traceback
+        """
+        user = call.from_user
+        data = call.data
+
+        # 1. Сообщаем пользователю
+        notify_user_error(call.message.chat.id, markup=error_fallback_markup(data))
+
+        # 2. Пишем в лог-файл
+        logger.exception(f"Ошибка в callback '{data}' для пользователя {user.id}: {exc}")
+
+        # 3. Шлём админу подробный отчёт
+        full_error = traceback.format_exc()
+        notify_admin_error(user, data, full_error)
+
+    @bot.callback_query_handler(func=lambda call: router.resolve(call.data) is not None)
+    def callbacks(call):
+        """
+        Нажатия кнопок, для которых в router есть маршрут (точный callback_data
+        или префикс); метрики и ошибки — тоже на роутере.
+        """
+        user = call.from_user
+        logger.info(
+            f"Callback '{call.data}' от пользователя {user.id} @{user.username}",
+            extra={"event": "callback", "user_id": user.id, "chat_id": call.message.chat.id, "action": call.data},
+        )
+        router.dispatch(call)
@@ -0,0 +1,366 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+from config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_PRIVATE_RATE, OUTBOX_PRIVATE_BURST,
+    OUTBOX_INTERACTIVE_RATE, OUTBOX_INTERACTIVE_BURST,
+    OUTBOX_GROUP_PER_MINUTE, OUTBOX_GROUP_BURST, OUTBOX_WORKERS, OUTBOX_MAX_RETRIES,
+)
+from metrics import API_RETRIES
+
+
+INTERACTIVE = 0
+BULK = 1
+
+# Метод -> позиция chat_id среди позиционных аргументов
+THROTTLED_METHODS = {
+    "send_message": 0,
+    "send_photo": 0,
+    "send_media_group": 0,
+    "send_document": 0,
+    "copy_message": 0,
+    "forward_message": 0,
+    "edit_message_text": 1,
+    "edit_message_caption": 1,
+    "edit_message_media": 1,
+    "edit_message_reply_markup": 0,
+}
+# Методы, которые Telegram считает за столько сообщений, сколько в них элементов
+ITEMS_ARG = {
+    "send_media_group": ("media", 1),
+}
+PRUNE_INTERVAL = 60
+
+
+# ========================================================================
+#            ОЧЕРЕДЬ ИСХОДЯЩИХ СООБЩЕНИЙ С ЛИМИТАМИ TELEGRAM
+# ========================================================================
+#
+# Все отправки проходят через один планировщик:
+#   - общий лимит (~30 сообщений/с на бота);
+#   - лимит на чат: 1/с в личке, 20/мин в группах и каналах;
+#   - ответы пользователям (INTERACTIVE) идут раньше фоновых (BULK), а в
+#     личке у них свой, более щедрый лимит: экран из фото и текста,
+#     открытый нажатием кнопки, не ждёт секунду на каждое сообщение;
+#   - альбом стоит столько токенов, сколько в нём фото;
+#   - при 429 чат ставится на паузу на retry_after, запрос повторяется.
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now, cost=1):
+        """
+        Через сколько секунд можно будет отправить cost сообщений (0 — можно сейчас).
+        Запрос дороже ёмкости ждёт полного ведра и уводит его в минус.
+        """
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        need = min(cost, self.capacity)
+        if self.tokens < need:
+            wait = max(wait, (need - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, cost=1):
+        self.tokens -= cost
+
+    def block(self, now, seconds):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class _Job:
+    __slots__ = (
+        "priority", "seq", "chat_id", "fn", "args", "kwargs", "cost", "future", "attempts", "queued_at",
+    )
+
+    def __init__(self, priority, seq, chat_id, fn, args, kwargs, cost=1):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cost = cost
+        self.future = Future()
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _rewind(value):
+    """
+    Перед повтором возвращает открытые файлы (в т.ч. внутри InputMedia) в начало.
+    """
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            _rewind(getattr(item, "media", item))
+    elif hasattr(value, "seek"):
+        try:
+            value.seek(0)
+        except Exception:
+            pass
+
+
+def _retry_after(exc):
+    try:
+        return float(exc.result_json["parameters"]["retry_after"])
+    except Exception:
+        return None
+
+
+class OutboundScheduler:
+    def __init__(self, logger, global_rate=30.0, private_rate=1.0, private_burst=5,
+                 group_per_minute=20, group_burst=3, workers=8, max_retries=3,
+                 interactive_rate=3.0, interactive_burst=10):
+        self.logger = logger
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.interactive_rate = interactive_rate
+        self.interactive_burst = interactive_burst
+        self.group_rate = group_per_minute / 60.0
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._interactive_buckets = {}  # только личные чаты
+        self._pending = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox")
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.wait_total = 0.0
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="outbox-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    # ---------------------------- очередь ----------------------------
+
+    @staticmethod
+    def _is_group(chat_id):
+        try:
+            return int(chat_id) < 0
+        except (TypeError, ValueError):
+            return True  # @username каналов
+
+    def _bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if self._is_group(chat_id):
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _job_bucket(self, job):
+        """
+        Лимит, из которого берёт токены задача: у INTERACTIVE в личке — свой.
+        """
+        if job.priority != INTERACTIVE or self._is_group(job.chat_id):
+            return self._bucket(job.chat_id)
+        bucket = self._interactive_buckets.get(job.chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.interactive_rate, self.interactive_burst)
+            self._interactive_buckets[job.chat_id] = bucket
+        return bucket
+
+    def _block_chat(self, chat_id, now, seconds):
+        self._bucket(chat_id).block(now, seconds)
+        bucket = self._interactive_buckets.get(chat_id)
+        if bucket is not None:
+            bucket.block(now, seconds)
+
+    def _push(self, job):
+        heapq.heappush(self._pending.setdefault(job.chat_id, []), job)
+        self._cond.notify()
+
+    # chat_id и fn — только позиционные: edit_message_* получают chat_id именованным
+    def submit(self, chat_id, fn, /, *args, priority=INTERACTIVE, cost=1, **kwargs):
+        """
+        cost — сколько сообщений Telegram насчитает за запрос (фото в альбоме).
+        """
+        job = _Job(priority, next(self._seq), chat_id, fn, args, kwargs, cost)
+        with self._cond:
+            self._push(job)
+        return job.future
+
+    def call(self, chat_id, fn, /, *args, priority=INTERACTIVE, cost=1, **kwargs):
+        return self.submit(chat_id, fn, *args, priority=priority, cost=cost, **kwargs).result()
+
+    def _next_job(self):
+        """
+        Самая приоритетная задача среди чатов, у которых сейчас есть токен.
+        Возвращает (задача, 0) или (None, сколько ждать).
+        """
+        now = time.monotonic()
+        best = None
+        min_wait = None
+        for heap in self._pending.values():
+            wait = self._job_bucket(heap[0]).delay(now, heap[0].cost)
+            if wait > 0:
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+                continue
+            if best is None or heap[0] < best:
+                best = heap[0]
+
+        if best is None:
+            return None, min_wait
+        global_wait = self._global.delay(now, best.cost)
+        if global_wait > 0:
+            return None, global_wait
+
+        heap = self._pending[best.chat_id]
+        heapq.heappop(heap)
+        if not heap:
+            del self._pending[best.chat_id]
+        self._global.consume(best.cost)
+        self._job_bucket(best).consume(best.cost)
+        return best, 0
+
+    def _prune_buckets(self, now):
+        """
+        Убирает лимиты чатов, которые давно ничего не отправляли.
+        """
+        for buckets in (self._chat_buckets, self._interactive_buckets):
+            for chat_id in list(buckets):
+                bucket = buckets[chat_id]
+                if chat_id not in self._pending and bucket.delay(now) == 0 and bucket.tokens >= bucket.capacity:
+                    del buckets[chat_id]
+
+    def _dispatch_loop(self):
+        last_prune = time.monotonic()
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                if now - last_prune > PRUNE_INTERVAL:
+                    self._prune_buckets(now)
+                    last_prune = now
+                job, wait = self._next_job()
+                while job is None:
+                    self._cond.wait(timeout=wait)
+                    job, wait = self._next_job()
+            self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        if job.attempts == 0:
+            with self._cond:
+                self.wait_total += time.monotonic() - job.queued_at
+        if job.attempts:
+            for value in list(job.args) + list(job.kwargs.values()):
+                _rewind(value)
+        job.attempts += 1
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            delay = _retry_after(e)
+            if e.error_code == 429 and delay is not None and job.attempts <= self.max_retries:
+                with self._cond:
+                    self.rate_limited += 1
+                    self.retried += 1
+                    self._block_chat(job.chat_id, time.monotonic(), delay)
+                    self._push(job)
+                API_RETRIES.inc(getattr(job.fn, "__name__", "unknown"))
+                self.logger.warning(f"429 для chat({job.chat_id}), повтор через {delay} с")
+                return
+            with self._cond:
+                self.failed += 1
+                if e.error_code == 429:
+                    self.rate_limited += 1
+            job.future.set_exception(e)
+            return
+        except Exception as e:
+            with self._cond:
+                self.failed += 1
+            job.future.set_exception(e)
+            return
+
+        with self._cond:
+            self.sent += 1
+        job.future.set_result(result)
+
+    # --------------------------- метрики ---------------------------
+
+    def stats(self):
+        with self._cond:
+            depth = {INTERACTIVE: 0, BULK: 0}
+            for heap in self._pending.values():
+                for job in heap:
+                    depth[job.priority] = depth.get(job.priority, 0) + 1
+            return {
+                "queued_interactive": depth[INTERACTIVE],
+                "queued_bulk": depth[BULK],
+                "waiting_chats": len(self._pending),
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "rate_limited": self.rate_limited,
+                "avg_queue_wait_ms": round(1000 * self.wait_total / max(1, self.sent + self.failed), 2),
+            }
+
+
+class ThrottledBot:
+    """
+    Обёртка над TeleBot: методы отправки идут через OutboundScheduler,
+    всё остальное (декораторы обработчиков, delete_message и т.д.) — напрямую.
+    Дополнительные аргументы методов отправки:
+      priority=INTERACTIVE|BULK, wait=True (False — вернуть Future).
+    """
+
+    def __init__(self, bot, scheduler):
+        self._bot = bot
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        method = getattr(self._bot, name)
+        if name not in THROTTLED_METHODS:
+            return method
+
+        chat_arg = THROTTLED_METHODS[name]
+        items_arg = ITEMS_ARG.get(name)
+
+        def send(*args, priority=INTERACTIVE, wait=True, **kwargs):
+            chat_id = kwargs.get("chat_id")
+            if chat_id is None and len(args) > chat_arg:
+                chat_id = args[chat_arg]
+            cost = 1
+            if items_arg is not None:
+                items = kwargs.get(items_arg[0])
+                if items is None and len(args) > items_arg[1]:
+                    items = args[items_arg[1]]
+                cost = max(1, len(items or ()))
+            future = self._scheduler.submit(chat_id, method, *args, priority=priority, cost=cost, **kwargs)
+            return future.result() if wait else future
+        return send
+
+
+def create_outbox(logger):
+    return OutboundScheduler(
+        logger,
+        global_rate=OUTBOX_GLOBAL_RATE,
+        private_rate=OUTBOX_PRIVATE_RATE,
+        private_burst=OUTBOX_PRIVATE_BURST,
+        interactive_rate=OUTBOX_INTERACTIVE_RATE,
+        interactive_burst=OUTBOX_INTERACTIVE_BURST,
+        group_per_minute=OUTBOX_GROUP_PER_MINUTE,
+        group_burst=OUTBOX_GROUP_BURST,
+        workers=OUTBOX_WORKERS,
+        max_retries=OUTBOX_MAX_RETRIES,
+    )
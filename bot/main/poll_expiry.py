@@ -0,0 +1,76 @@
+import heapq
+import threading
+import time
+
+
+# ========================================================================
+#              ЗАКРЫТИЕ ОПРОСОВ ПО ВРЕМЕНИ (В ФОНЕ)
+# ========================================================================
+#
+# Куча (end_at, poll_id) и один поток, который спит до ближайшего end_at.
+# Пока опросов нет, поток просто ждёт на Condition и не тратит CPU.
+# При запуске очередь заново строится из открытых опросов хранилища,
+# поэтому перезапуск бота ничего не теряет; опросы, истёкшие, пока бот
+# не работал, закрываются сразу.
+
+# Даже при далёком end_at поток просыпается не реже, чем раз в это время
+# (на случай перевода системных часов)
+MAX_SLEEP_SECONDS = 300
+
+
+class PollExpiryScheduler:
+    def __init__(self, storage, on_expire, logger):
+        """
+        on_expire(poll_id) вызывается в потоке планировщика, когда наступил end_at.
+        """
+        self.storage = storage
+        self.on_expire = on_expire
+        self.logger = logger
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self.expired = 0
+
+    def start(self):
+        polls = self.storage.find_open_polls()
+        with self._cond:
+            for poll in polls:
+                heapq.heappush(self._heap, (poll["end_at"], poll["poll_id"]))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="poll-expiry", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        self.logger.info(f"Планировщик закрытия опросов: открытых опросов {len(polls)}")
+
+    def schedule(self, poll_id, end_at):
+        with self._cond:
+            heapq.heappush(self._heap, (end_at, poll_id))
+            self._cond.notify()
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)
+                timeout = None
+                if self._heap:
+                    timeout = min(self._heap[0][0] - now, MAX_SLEEP_SECONDS)
+                self._cond.wait(timeout=timeout)
+
+    def _run(self):
+        while True:
+            end_at, poll_id = self._next_due()
+            poll = self.storage.get_poll(poll_id)
+            # Опрос уже закрыт вручную или срок изменился — запись устарела
+            if not poll or poll.get("closed") or poll["end_at"] != end_at:
+                continue
+            try:
+                self.on_expire(poll_id)
+                self.expired += 1
+            except Exception as e:
+                self.logger.error(f"Ошибка при закрытии опроса {poll_id} по времени: {e}")
+
+    def stats(self):
+        with self._cond:
+            return {"scheduled": len(self._heap), "expired": self.expired}
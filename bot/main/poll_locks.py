@@ -0,0 +1,45 @@
+import threading
+from contextlib import contextmanager
+
+
+# ========================================================================
+#                   БЛОКИРОВКИ ОПРОСОВ (ЧТЕНИЕ-ИЗМЕНЕНИЕ-ЗАПИСЬ)
+# ========================================================================
+#
+# TeleBot вызывает обработчики из пула потоков. Голоса в одном опросе
+# выполняются по очереди, разные опросы — параллельно. Используется
+# фиксированный набор блокировок («полосы»): опрос попадает в полосу по хэшу id.
+
+
+class PollLockManager:
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.contended = 0
+
+    def _lock_for(self, poll_id):
+        return self._locks[hash(poll_id) % len(self._locks)]
+
+    @contextmanager
+    def hold(self, poll_id):
+        """
+        Блокировка опроса. Если её уже держит другой поток,
+        увеличивается счётчик contended и поток ждёт своей очереди.
+        """
+        lock = self._lock_for(poll_id)
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            lock.acquire()
+        try:
+            with self._stats_lock:
+                self.acquired += 1
+                if contended:
+                    self.contended += 1
+            yield
+        finally:
+            lock.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {"acquired": self.acquired, "contended": self.contended}
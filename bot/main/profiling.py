@@ -0,0 +1,252 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from config import (
+    PROFILE_ENABLED, PROFILE_THRESHOLD_MS, PROFILE_DIR,
+    PROFILE_KEEP, PROFILE_SAMPLE_INTERVAL_MS,
+)
+
+
+# ========================================================================
+#              ПРОФИЛИРОВАНИЕ МЕДЛЕННЫХ ОБРАБОТЧИКОВ
+# ========================================================================
+#
+# Включается PROFILE_ENABLED. Пока обработчик выполняется, фоновый поток
+# раз в PROFILE_SAMPLE_INTERVAL_MS снимает стек его потока
+# (sys._current_frames), а код отмечает фазы через phase("имя").
+# Если обработчик работал дольше PROFILE_THRESHOLD_MS, фазы и свёрнутые
+# стеки (формат folded: «корень;...;лист число», подходит для flamegraph)
+# пишутся в PROFILE_DIR; хранятся последние PROFILE_KEEP файлов.
+# Быстрые обработчики ничего не пишут, а выборка стека не замедляет сам
+# обработчик, в отличие от cProfile.
+# В режиме asyncio корутины делят один поток, поэтому для них
+# сохраняется только длительность, без фаз и стеков.
+
+MAX_STACK_DEPTH = 64
+TOP_STACKS = 200
+RECENT_SIZE = 200
+
+
+class _Record:
+    __slots__ = ("name", "thread_id", "started", "wall", "phases", "samples", "sampled")
+
+    def __init__(self, name, thread_id, sampled):
+        self.name = name
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        self.phases = {}        # имя -> [секунды, раз]
+        self.samples = Counter()
+        self.sampled = sampled
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def _in_event_loop():
+    try:
+        return asyncio.get_running_loop() is not None
+    except RuntimeError:
+        return False
+
+
+class HandlerProfiler:
+    def __init__(self, logger=None, enabled=False, threshold=1.0, directory="profiles",
+                 keep=100, interval=0.01):
+        self.logger = logger
+        self.enabled = enabled
+        self.threshold = threshold
+        self.directory = Path(directory)
+        self.keep = keep
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._active = {}   # id потока -> _Record (только синхронные обработчики)
+        self._recent = deque(maxlen=RECENT_SIZE)
+        self._local = threading.local()
+        self._sampler = None
+        self.written = 0
+
+    # ------------------------- обработчик -------------------------
+
+    def begin(self, name):
+        if not self.enabled:
+            return None
+        sampled = not _in_event_loop()
+        record = _Record(name, threading.get_ident(), sampled)
+        if sampled:
+            with self._cond:
+                self._active[record.thread_id] = record
+                self._start_sampler()
+                self._cond.notify()
+            self._local.record = record
+        return record
+
+    def end(self, record):
+        if record is None:
+            return
+        elapsed = time.perf_counter() - record.started
+        if record.sampled:
+            with self._cond:
+                self._active.pop(record.thread_id, None)
+            self._local.record = None
+        if elapsed < self.threshold:
+            return
+        path = None
+        try:
+            path = self._write(record, elapsed)
+        except Exception as e:
+            if self.logger:
+                self.logger.warning(f"Не удалось сохранить профиль {record.name}: {e}")
+        phases = sorted(record.phases.items(), key=lambda item: -item[1][0])
+        with self._cond:
+            self._recent.append({
+                "handler": record.name,
+                "at": record.wall,
+                "duration_ms": round(elapsed * 1000),
+                "phases": [(name, round(seconds * 1000)) for name, (seconds, _count) in phases],
+                "file": path.name if path else None,
+            })
+
+    @contextmanager
+    def phase(self, name):
+        record = getattr(self._local, "record", None) if self.enabled else None
+        if record is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = record.phases.setdefault(name, [0.0, 0])
+            entry[0] += time.perf_counter() - started
+            entry[1] += 1
+
+    def slowest(self, limit=10):
+        with self._cond:
+            recent = list(self._recent)
+        return sorted(recent, key=lambda item: -item["duration_ms"])[:limit]
+
+    # --------------------------- выборка ---------------------------
+
+    def _start_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            frames = sys._current_frames()
+            # Под lock'ом: end() снимает запись с учёта до того, как пишет файл
+            with self._cond:
+                for thread_id, record in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        record.samples[_fold(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+    # ---------------------------- файлы ----------------------------
+
+    def _write(self, record, elapsed):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.fromtimestamp(record.wall).strftime("%Y%m%d-%H%M%S")
+        safe_name = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in record.name).strip("_")
+        path = self.directory / f"{stamp}-{int(elapsed * 1000)}ms-{safe_name}.folded"
+
+        lines = [
+            f"# handler: {record.name}",
+            f"# started: {datetime.fromtimestamp(record.wall).isoformat(timespec='milliseconds')}",
+            f"# duration_ms: {elapsed * 1000:.1f}",
+        ]
+        for name, (seconds, count) in sorted(record.phases.items(), key=lambda item: -item[1][0]):
+            lines.append(f"# phase: {name} {seconds * 1000:.1f} ms x{count}")
+        if record.sampled:
+            lines.append(f"# samples: {sum(record.samples.values())} every {self.interval * 1000:.0f} ms")
+            for stack, count in record.samples.most_common(TOP_STACKS):
+                lines.append(f"{stack} {count}")
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        self.written += 1
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        files = sorted(self.directory.glob("*.folded"))
+        for old in files[:max(0, len(files) - self.keep)]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {"active": len(self._active), "recent_slow": len(self._recent), "written": self.written}
+
+
+handler_profiler = HandlerProfiler(
+    enabled=PROFILE_ENABLED,
+    threshold=PROFILE_THRESHOLD_MS / 1000,
+    directory=PROFILE_DIR,
+    keep=PROFILE_KEEP,
+    interval=PROFILE_SAMPLE_INTERVAL_MS / 1000,
+)
+
+
+def phase(name):
+    """
+    Отмечает фазу текущего обработчика: with phase("send_media_group"): ...
+    При выключенном профилировании ничего не делает.
+    """
+    return handler_profiler.phase(name)
+
+
+# ========================================================================
+#                    КОМАНДА АДМИНА /slow
+# ========================================================================
+
+def _format_slowest(entries):
+    if not entries:
+        return "Медленных обработчиков пока не было."
+    lines = []
+    for entry in entries:
+        at = datetime.fromtimestamp(entry["at"]).strftime("%d.%m %H:%M:%S")
+        lines.append(f"{entry['duration_ms']} мс — {entry['handler']} ({at})")
+        if entry["phases"]:
+            lines.append("   " + ", ".join(f"{name} {ms} мс" for name, ms in entry["phases"][:5]))
+        if entry["file"]:
+            lines.append(f"   {entry['file']}")
+    return "\n".join(lines)
+
+
+def register_profiling_handlers(bot, logger, admin_id):
+    handler_profiler.logger = logger
+
+    @bot.message_handler(commands=["slow"])
+    def handle_slow(message):
+        try:
+            if int(message.from_user.id) != int(admin_id):
+                return
+        except Exception:
+            return
+        if not handler_profiler.enabled:
+            bot.send_message(message.chat.id, "Профилирование выключено (PROFILE_ENABLED).")
+            return
+        parts = message.text.split()
+        limit = min(int(parts[1]), 30) if len(parts) > 1 and parts[1].isdigit() else 10
+        header = f"Самые медленные обработчики (порог {handler_profiler.threshold * 1000:.0f} мс):\n"
+        bot.send_message(message.chat.id, header + _format_slowest(handler_profiler.slowest(limit)))
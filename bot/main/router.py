@@ -0,0 +1,127 @@
+from metrics import track_handler, HANDLER_ERRORS
+
+
+# ========================================================================
+#                  МАРШРУТИЗАЦИЯ НАЖАТИЙ КНОПОК
+# ========================================================================
+#
+# Обработчик регистрируется по точному callback_data ("about_me") или по
+# префиксу ("cat_", "vote:"). Точное совпадение ищется в dict, префикс —
+# срезом data[:длина] по одному dict на каждую встречающуюся длину
+# префикса (их единицы), поэтому время поиска не растёт с числом
+# категорий и опросов. Перебора условий в порядке регистрации нет:
+# у каждого callback_data ровно один маршрут.
+#
+# Общее для всех маршрутов делает dispatch():
+#   - время и ошибки — в метриках callback:<имя маршрута> (track_handler);
+#   - исключение обработчика передаётся в on_error маршрута, а если его
+#     нет — в общий обработчик ошибок роутера.
+
+
+class Route:
+    __slots__ = ("name", "handler", "on_error")
+
+    def __init__(self, name, handler, on_error):
+        self.name = name
+        self.handler = handler
+        self.on_error = on_error
+
+
+class CallbackRouter:
+    def __init__(self, logger, on_error=None):
+        self.logger = logger
+        self.on_error = on_error
+        self._exact = {}
+        self._prefixes = {}         # длина префикса -> {префикс: Route}
+        self._prefix_lengths = ()   # по убыванию: выигрывает самый длинный префикс
+
+    def add(self, handler, data=None, prefix=None, name=None, on_error=None):
+        """
+        handler(call) — для точного data или для всех data, начинающихся с prefix.
+        name — метка в метриках; по умолчанию сам data/prefix.
+        """
+        if (data is None) == (prefix is None):
+            raise ValueError("Нужен ровно один из аргументов: data или prefix")
+        key = data if data is not None else prefix
+        route = Route(name or key, handler, on_error)
+
+        if data is not None:
+            if data in self._exact:
+                raise ValueError(f"Маршрут '{data}' уже зарегистрирован")
+            self._exact[data] = route
+        else:
+            if not prefix:
+                raise ValueError("Префикс не может быть пустым")
+            by_prefix = self._prefixes.setdefault(len(prefix), {})
+            if prefix in by_prefix:
+                raise ValueError(f"Префикс '{prefix}' уже зарегистрирован")
+            by_prefix[prefix] = route
+            self._prefix_lengths = tuple(sorted(self._prefixes, reverse=True))
+        return route
+
+    def route(self, *data, prefix=None, name=None, on_error=None):
+        """
+        Декоратор: @router.route("my_job", "back_categories") или
+        @router.route(prefix="cat_").
+        """
+        def decorator(handler):
+            for value in data:
+                self.add(handler, data=value, name=name, on_error=on_error)
+            if prefix is not None:
+                self.add(handler, prefix=prefix, name=name, on_error=on_error)
+            return handler
+        return decorator
+
+    def error_handler(self, handler):
+        """
+        Декоратор общего обработчика ошибок: handler(call, exc).
+        """
+        self.on_error = handler
+        return handler
+
+    def resolve(self, data):
+        if not data:
+            return None
+        route = self._exact.get(data)
+        if route is not None:
+            return route
+        for length in self._prefix_lengths:
+            if len(data) >= length:
+                route = self._prefixes[length].get(data[:length])
+                if route is not None:
+                    return route
+        return None
+
+    # --------------------------- вызов ---------------------------
+
+    def _unknown(self, call):
+        self.logger.warning(f"Callback '{call.data}' без маршрута от пользователя {call.from_user.id}")
+
+    def _error_handler(self, route):
+        return route.on_error or self.on_error
+
+    def _run(self, route, call):
+        metric = f"callback:{route.name}"
+        with track_handler(metric):
+            try:
+                route.handler(call)
+            except Exception as e:
+                HANDLER_ERRORS.inc(metric)
+                on_error = self._error_handler(route)
+                if on_error is None:
+                    self.logger.exception(f"Ошибка в callback '{call.data}': {e}")
+                else:
+                    on_error(call, e)
+
+    def dispatch(self, call):
+        route = self.resolve(call.data)
+        if route is None:
+            self._unknown(call)
+            return
+        self._run(route, call)
+
+    def stats(self):
+        return {
+            "exact_routes": len(self._exact),
+            "prefix_routes": sum(len(routes) for routes in self._prefixes.values()),
+        }
@@ -0,0 +1,118 @@
+from telebot import types
+
+from derivatives import derivative_path
+from texts import BUTTONS, MESSAGES, TITLES
+from works import WELCOME_PHOTO, ABOUT_PHOTO
+
+
+CHANNEL_URL = "https://t.me/dollminiature"
+MASTERCLASS_URL = "https://disk.yandex.ru/i/5SeUgQ1cjjok0Q"
+
+
+# ========================================================================
+#                 КЛАВИАТУРЫ ЭКРАНОВ (ОБЩИЕ ДЛЯ ВСЕХ РЕЖИМОВ)
+# ========================================================================
+
+def create_buttons(*rows):
+    """
+    Создаёт InlineKeyboardMarkup из нескольких строк кнопок.
+    rows: список списков кнопок.
+    """
+    markup = types.InlineKeyboardMarkup()
+    for row in rows:
+        markup.add(*row)
+    return markup
+
+
+def back_markup(callback_data):
+    return create_buttons(
+        [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data=callback_data)]
+    )
+
+
+def main_menu_markup():
+    return create_buttons(
+        [types.InlineKeyboardButton(BUTTONS["ABOUT_ME"], callback_data="about_me")],
+        [types.InlineKeyboardButton(BUTTONS["FREE_MASTER"], callback_data="check")],
+        [types.InlineKeyboardButton(BUTTONS["MY_WORKS"], callback_data="my_job")]
+    )
+
+
+def categories_markup(categories):
+    markup = types.InlineKeyboardMarkup()
+
+    for i in range(0, len(categories), 2):
+        left_key, left_title = categories[i]
+        row = [types.InlineKeyboardButton(left_title, callback_data=f"cat_{left_key}")]
+        if i + 1 < len(categories):
+            right_key, right_title = categories[i + 1]
+            row.append(types.InlineKeyboardButton(right_title, callback_data=f"cat_{right_key}"))
+        markup.add(*row)
+
+    markup.add(types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_main"))
+    return markup
+
+
+def subscription_markup():
+    return create_buttons(
+        [types.InlineKeyboardButton(BUTTONS["CHANNEL"], url=CHANNEL_URL)],
+        [types.InlineKeyboardButton(BUTTONS["CHECK_SUB"], callback_data="check_subscription")],
+        [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_main")]
+    )
+
+
+def subscribed_markup():
+    return create_buttons(
+        [types.InlineKeyboardButton(BUTTONS["MASTERCLASS_LINK"], url=MASTERCLASS_URL)],
+        [types.InlineKeyboardButton(BUTTONS["BACK"], callback_data="back_subscribe")]
+    )
+
+
+def error_fallback_markup(data):
+    if data.startswith("cat_"):
+        return back_markup("back_categories")
+    return back_markup("back_main")
+
+
+# ========================================================================
+#                   ЭКРАНЫ КАК НАБОР СООБЩЕНИЙ
+# ========================================================================
+#
+# Экран — список частей: фото (с подписью) или текст. Так экран можно
+# и отправить заново, и получить редактированием уже показанных сообщений.
+
+def photo_part(path, caption=None, markup=None, parse_mode=None):
+    return {"kind": "photo", "path": str(path), "caption": caption, "markup": markup, "parse_mode": parse_mode}
+
+
+def text_part(text, markup=None, parse_mode=None):
+    return {"kind": "text", "text": text, "markup": markup, "parse_mode": parse_mode}
+
+
+def main_menu_screen():
+    # Приветственное фото и меню — одно сообщение с подписью
+    return [photo_part(derivative_path(WELCOME_PHOTO), caption=MESSAGES["START"], markup=main_menu_markup())]
+
+
+def about_screen():
+    # Текст «Обо мне» длиннее лимита подписи (1024), поэтому два сообщения
+    return [
+        photo_part(derivative_path(ABOUT_PHOTO)),
+        text_part(MESSAGES["ABOUT_ME"], markup=back_markup("back_main"), parse_mode="Markdown"),
+    ]
+
+
+def categories_screen(categories):
+    return [text_part(TITLES["CHOOSE_CATEGORY"], markup=categories_markup(categories))]
+
+
+def subscription_screen():
+    return [text_part(MESSAGES["SUBSCRIBE"], markup=subscription_markup())]
+
+
+def subscribed_screen():
+    return [text_part(MESSAGES["THANKS_FOR_SUB"], markup=subscribed_markup())]
+
+
+def not_subscribed_screen():
+    return [text_part(MESSAGES["NOT_SUBSCRIBED"], markup=back_markup("back_subscribe"))]
@@ -1,10 +1,230 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from telebot.apihelper import ApiTelegramException
 
+from config import (
+    SUBSCRIPTION_POSITIVE_TTL, SUBSCRIPTION_NEGATIVE_TTL, SUBSCRIPTION_CACHE_SIZE,
+    SUBSCRIPTION_CHECK_RATE, SUBSCRIPTION_CHECK_WORKERS,
+)
+from outbox import TokenBucket
+
+
+# ========================================================================
+#                 КЭШ ПРОВЕРОК ПОДПИСКИ НА КАНАЛ
+# ========================================================================
+#
+# Результат get_chat_member запоминается: «подписан» — на
+# SUBSCRIPTION_POSITIVE_TTL секунд, «не подписан» — на
+# SUBSCRIPTION_NEGATIVE_TTL. Обновления chat_member из канала (бот должен
+# быть администратором) сразу заменяют запись, поэтому только что
+# подписавшийся пользователь не ждёт истечения срока.
+
+
+def _is_member(status):
+    return status not in ('left', 'kicked')
+
+
+def _key(chat_id, user_id):
+    # В хранилище опросов id пользователей — строки, в апдейтах — числа
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        pass
+    return str(chat_id), user_id
+
+
+class SubscriptionCache:
+    def __init__(self, positive_ttl=600, negative_ttl=60, max_entries=100000):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, chat_id, user_id):
+        """
+        True/False из кэша или None, если записи нет или она устарела.
+        """
+        key = _key(chat_id, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, chat_id, user_id, subscribed):
+        ttl = self.positive_ttl if subscribed else self.negative_ttl
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._prune(now)
+            self._entries[_key(chat_id, user_id)] = (subscribed, now + ttl)
+
+    def _prune(self, now):
+        """
+        Убирает устаревшие записи; если их нет — самую старую половину.
+        """
+        expired = [key for key, (_value, expires) in self._entries.items() if expires <= now]
+        if not expired:
+            expired = list(self._entries)[:len(self._entries) // 2]
+        for key in expired:
+            del self._entries[key]
+
+    def invalidate(self, chat_id, user_id):
+        with self._lock:
+            self._entries.pop(_key(chat_id, user_id), None)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+subscription_cache = SubscriptionCache(
+    positive_ttl=SUBSCRIPTION_POSITIVE_TTL,
+    negative_ttl=SUBSCRIPTION_NEGATIVE_TTL,
+    max_entries=SUBSCRIPTION_CACHE_SIZE,
+)
+
+
 def is_subscribed(bot, chat_id, user_id):
+    cached = subscription_cache.get(chat_id, user_id)
+    if cached is not None:
+        return cached
+
     try:
         response = bot.get_chat_member(chat_id, user_id)
-        return response.status not in ('left', 'kicked')
+        subscribed = _is_member(response.status)
     except ApiTelegramException as e:
         if e.result_json['error_code'] == 400:
-            return False
-        raise
\ No newline at end of file
+            subscribed = False
+        else:
+            raise
+    subscription_cache.put(chat_id, user_id, subscribed)
+    return subscribed
+
+
+def is_channel_update(update, channel_id):
+    """
+    Относится ли обновление chat_member к каналу channel_id
+    (числовой id или @username).
+    """
+    chat = update.chat
+    channel = str(channel_id)
+    if channel == str(chat.id):
+        return True
+    return bool(chat.username) and channel.lower() == f"@{chat.username}".lower()
+
+
+def apply_chat_member_update(update, channel_id):
+    """
+    Подписка/отписка в канале: сразу записываем новый статус в кэш.
+    """
+    user_id = update.new_chat_member.user.id
+    subscription_cache.invalidate(channel_id, user_id)
+    subscription_cache.put(channel_id, user_id, _is_member(update.new_chat_member.status))
+
+
+# ========================================================================
+#                 МАССОВАЯ ПРОВЕРКА ПОДПИСКИ (ДЛЯ ОПРОСОВ)
+# ========================================================================
+
+def _retry_after(exc):
+    try:
+        return float(exc.result_json["parameters"]["retry_after"])
+    except Exception:
+        return None
+
+
+class _SharedBucket:
+    """
+    TokenBucket из outbox, общий для нескольких потоков.
+    """
+
+    def __init__(self, rate):
+        self._bucket = TokenBucket(rate, max(1.0, rate))
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                wait = self._bucket.delay(time.monotonic())
+                if wait == 0:
+                    self._bucket.consume()
+                    return
+            time.sleep(wait)
+
+    def block(self, seconds):
+        with self._lock:
+            self._bucket.block(time.monotonic(), seconds)
+
+
+def check_subscriptions(bot, chat_id, user_ids, logger=None,
+                        rate=SUBSCRIPTION_CHECK_RATE, workers=SUBSCRIPTION_CHECK_WORKERS):
+    """
+    Проверяет подписку многих пользователей: сначала по кэшу,
+    остальных — параллельно, не чаще rate запросов в секунду.
+    Возвращает {user_id: True/False}; None — проверить не удалось.
+    """
+    result = {}
+    missing = []
+    for user_id in user_ids:
+        cached = subscription_cache.get(chat_id, user_id)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            result[user_id] = cached
+    if not missing:
+        return result
+
+    bucket = _SharedBucket(rate)
+    started = time.monotonic()
+
+    def check(user_id):
+        for _attempt in range(3):
+            bucket.acquire()
+            try:
+                response = bot.get_chat_member(chat_id, user_id)
+            except Exception as e:
+                # В режиме asyncio исключение другого класса, поэтому по коду ошибки
+                error_code = getattr(e, "error_code", None)
+                if error_code == 400:
+                    subscribed = False
+                    break
+                delay = _retry_after(e) if error_code == 429 else None
+                if delay is None:
+                    if logger:
+                        logger.warning(f"Не удалось проверить подписку {user_id}: {e}")
+                    return None
+                bucket.block(delay)
+                continue
+            subscribed = _is_member(response.status)
+            break
+        else:
+            return None
+        subscription_cache.put(chat_id, user_id, subscribed)
+        return subscribed
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="sub-check") as executor:
+        for user_id, subscribed in zip(missing, executor.map(check, missing)):
+            result[user_id] = subscribed
+
+    if logger:
+        logger.info(
+            f"Проверка подписки: {len(result)} пользователей, из кэша {len(result) - len(missing)}, "
+            f"запросов {len(missing)} за {time.monotonic() - started:.1f} с"
+        )
+    return result
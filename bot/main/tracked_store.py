@@ -0,0 +1,228 @@
+import atexit
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from config import (
+    TRACKED_DB_PATH, TRACKED_MAX_CHATS, TRACKED_MAX_PER_CHAT,
+    TRACKED_TTL_SECONDS, TRACKED_FLUSH_INTERVAL,
+)
+
+
+# ========================================================================
+#            СООБЩЕНИЯ ТЕКУЩЕГО ЭКРАНА В КАЖДОМ ЧАТЕ (ОГРАНИЧЕННО)
+# ========================================================================
+#
+# Для каждого чата хранится только то, что сейчас показано: id сообщений
+# и их вид. Всё упаковано в один array("q") на чат: первый элемент —
+# время последнего изменения, дальше (message_id << 2) | вид,
+# т.е. 8 байт на сообщение. Число чатов ограничено (вытесняются давно
+# не активные, LRU), записи старше TTL удаляются: через 48 часов
+# Telegram всё равно не даёт удалить сообщение бота.
+# Если задан путь к SQLite, изменения сбрасываются на диск в фоне,
+# и после перезапуска старые меню по-прежнему можно убрать.
+
+KINDS = ("other", "photo", "text", "album")
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracked (
+    chat_id INTEGER PRIMARY KEY,
+    entries BLOB NOT NULL,
+    touched INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracked_touched ON tracked (touched);
+"""
+
+
+def _pack(message_id, kind):
+    return (message_id << 2) | _KIND_CODES.get(kind, 0)
+
+
+def _unpack(value):
+    return value >> 2, KINDS[value & 3]
+
+
+class TrackedMessageStore:
+    def __init__(self, path=None, max_chats=50000, max_per_chat=64,
+                 ttl=48 * 3600, flush_interval=2.0):
+        self.path = Path(path) if path else None
+        self.max_chats = max_chats
+        self.max_per_chat = max_per_chat
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # chat_id -> array("q") [touched, записи...]; порядок — LRU
+        self._chats = OrderedDict()
+        self._dirty = set()
+        self._conn = None
+        self._flusher = None
+        self._stop = threading.Event()
+        self.evicted = 0
+        self.expired = 0
+        if self.path is not None:
+            self._open()
+            self._load()
+            atexit.register(self.close)
+
+    # ---------------------------- память ----------------------------
+
+    def _evict(self, now):
+        """
+        Убирает записи старше TTL и самые давние чаты сверх лимита.
+        Чаты лежат в порядке последнего изменения, поэтому смотрим только начало.
+        """
+        deadline = now - self.ttl
+        while self._chats:
+            chat_id, entries = next(iter(self._chats.items()))
+            touched = entries[0]
+            if touched >= deadline and len(self._chats) <= self.max_chats:
+                break
+            self._chats.popitem(last=False)
+            self._dirty.add(chat_id)
+            if touched < deadline:
+                self.expired += 1
+            else:
+                self.evicted += 1
+
+    def add(self, chat_id, message_id, kind):
+        now = int(time.time())
+        with self._lock:
+            entries = self._chats.get(chat_id)
+            if entries is None:
+                entries = self._chats[chat_id] = array("q", [now])
+            else:
+                self._chats.move_to_end(chat_id)
+                entries[0] = now
+            entries.append(_pack(message_id, kind))
+            if len(entries) > self.max_per_chat + 1:
+                del entries[1:len(entries) - self.max_per_chat]
+            self._dirty.add(chat_id)
+            self._evict(now)
+        self._start_flusher()
+
+    def take(self, chat_id):
+        """
+        Забирает сообщения чата: список (message_id, вид).
+        """
+        with self._lock:
+            entries = self._chats.pop(chat_id, None)
+            if entries is None:
+                return []
+            self._dirty.add(chat_id)
+        self._start_flusher()
+        if entries[0] < time.time() - self.ttl:
+            return []
+        return [_unpack(value) for value in entries[1:]]
+
+    def ids(self, chat_id):
+        with self._lock:
+            entries = self._chats.get(chat_id)
+            if entries is None:
+                return set()
+            return {value >> 2 for value in entries[1:]}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chats": len(self._chats),
+                "messages": sum(len(entries) - 1 for entries in self._chats.values()),
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "dirty": len(self._dirty),
+            }
+
+    # ---------------------------- SQLite ----------------------------
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Соединением пользуется только flush(), под _flush_lock
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _load(self):
+        deadline = time.time() - self.ttl
+        self._conn.execute("DELETE FROM tracked WHERE touched < ?", (deadline,))
+        rows = self._conn.execute(
+            "SELECT chat_id, entries FROM tracked ORDER BY touched DESC LIMIT ?",
+            (self.max_chats,),
+        ).fetchall()
+        for chat_id, blob in reversed(rows):
+            entries = array("q")
+            entries.frombytes(blob)
+            self._chats[chat_id] = entries
+
+    def _start_flusher(self):
+        if self._conn is None or self._flusher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=run, name="tracked-flusher", daemon=True)
+        self._flusher.start()
+
+    def flush(self):
+        """
+        Сохраняет изменённые чаты одной транзакцией.
+        """
+        if self._conn is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                upserts = []
+                deletes = []
+                for chat_id in self._dirty:
+                    entries = self._chats.get(chat_id)
+                    if entries is None:
+                        deletes.append((chat_id,))
+                    else:
+                        upserts.append((chat_id, entries.tobytes(), entries[0]))
+                self._dirty.clear()
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM tracked WHERE chat_id = ?", deletes)
+                self._conn.executemany(
+                    "INSERT INTO tracked (chat_id, entries, touched) VALUES (?, ?, ?) "
+                    "ON CONFLICT (chat_id) DO UPDATE SET "
+                    "entries = excluded.entries, touched = excluded.touched",
+                    upserts,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                with self._lock:
+                    self._dirty.update(chat_id for chat_id, *_rest in upserts + deletes)
+                raise
+
+    def close(self):
+        self._stop.set()
+        if self._conn is None:
+            return
+        self.flush()
+        with self._flush_lock:
+            self._conn.close()
+            self._conn = None
+
+
+def create_tracked_store():
+    return TrackedMessageStore(
+        TRACKED_DB_PATH or None,
+        max_chats=TRACKED_MAX_CHATS,
+        max_per_chat=TRACKED_MAX_PER_CHAT,
+        ttl=TRACKED_TTL_SECONDS,
+        flush_interval=TRACKED_FLUSH_INTERVAL,
+    )
@@ -0,0 +1,813 @@
+import atexit
+import bisect
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import (
+    VOTES_BACKEND, VOTES_JSON_PATH, VOTES_DB_PATH,
+    VOTES_FLUSH_MODE, VOTES_FLUSH_INTERVAL, VOTES_FLUSH_EVERY,
+    VOTES_ARCHIVE, VOTES_ARCHIVE_DIR,
+)
+
+
+# ========================================================================
+#                  ХРАНИЛИЩЕ ОПРОСОВ (JSON / SQLite)
+# ========================================================================
+#
+# Обработчики голосования работают только через методы хранилища:
+#   create_poll, get_poll, get_poll_details, get_ballot,
+#   save_draft, confirm_vote, close_poll, has_polls, find_latest_poll,
+#   find_open_polls, iter_polls, get_tallies.
+# get_poll возвращает данные опроса без голосов (достаточно для проверки
+# клика), get_poll_details — полный словарь в формате votes.json плюс
+# "tallies": списки проголосовавших по каждому варианту.
+# Счётчики по вариантам обновляются при каждом подтверждении голоса,
+# get_tallies возвращает их за O(число вариантов).
+
+
+def _selections(value):
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def tally_voters(poll):
+    """
+    Списки проголосовавших по вариантам — один проход по голосам.
+    """
+    voters = [[] for _ in poll["options"]]
+    confirmed = poll.get("confirmed", {})
+    for user_id, value in poll.get("votes", {}).items():
+        if not confirmed.get(user_id, True):
+            continue
+        for option_idx in dict.fromkeys(_selections(value)):
+            if 0 <= option_idx < len(voters):
+                voters[option_idx].append(user_id)
+    return voters
+
+
+def _atomic_write(path, text):
+    """
+    Пишет во временный файл и подменяет исходный через rename.
+    Если rename невозможен (файл смонтирован в Docker отдельным томом),
+    пишет поверх исходного файла.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        with path.open("w", encoding="utf-8") as f:
+            f.write(text)
+        tmp_path.unlink()
+
+
+class PollArchive:
+    """
+    Холодный архив закрытых опросов: по файлу YYYY-MM.jsonl.gz на месяц
+    создания, одна строка — опрос в формате votes.json. Каждое добавление
+    дописывает в файл отдельный gzip-блок, поэтому старые данные не
+    перезаписываются. index.json хранит только poll_id -> [месяц,
+    created_at, chat_id]; сами месяцы читаются при первом обращении
+    и держатся в небольшом LRU-кэше.
+    """
+
+    def __init__(self, root, cache_months=4):
+        self.root = Path(root)
+        self.cache_months = cache_months
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self._months = OrderedDict()
+        self.loads = 0
+
+    def _load_index(self):
+        path = self.root / "index.json"
+        if not path.exists():
+            return {}
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    @staticmethod
+    def _month(poll):
+        return datetime.fromtimestamp(poll.get("created_at", 0), tz=timezone.utc).strftime("%Y-%m")
+
+    def _month_path(self, month):
+        return self.root / f"{month}.jsonl.gz"
+
+    def add(self, poll):
+        month = self._month(poll)
+        line = json.dumps(poll, sort_keys=True, ensure_ascii=True) + "\n"
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with gzip.open(self._month_path(month), "at", encoding="utf-8") as f:
+                f.write(line)
+            self._index[poll["poll_id"]] = [month, poll.get("created_at", 0), poll.get("chat_id")]
+            _atomic_write(self.root / "index.json", json.dumps(self._index, sort_keys=True))
+            self._months.pop(month, None)
+
+    def _load_month(self, month):
+        polls = self._months.get(month)
+        if polls is not None:
+            self._months.move_to_end(month)
+            return polls
+        polls = {}
+        path = self._month_path(month)
+        if path.exists():
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        poll = json.loads(line)
+                        polls[poll["poll_id"]] = poll  # при повторе побеждает последняя запись
+        self.loads += 1
+        self._months[month] = polls
+        while len(self._months) > self.cache_months:
+            self._months.popitem(last=False)
+        return polls
+
+    def get(self, poll_id):
+        with self._lock:
+            entry = self._index.get(poll_id)
+            if entry is None:
+                return None
+            poll = self._load_month(entry[0]).get(poll_id)
+            return json.loads(json.dumps(poll)) if poll else None
+
+    def entries(self):
+        """
+        (poll_id, created_at, chat_id) всех опросов архива — без чтения месяцев.
+        """
+        with self._lock:
+            return [(poll_id, created_at, chat_id) for poll_id, (_m, created_at, chat_id) in self._index.items()]
+
+    def iter_polls(self):
+        with self._lock:
+            months = sorted({entry[0] for entry in self._index.values()})
+        for month in months:
+            with self._lock:
+                polls = list(self._load_month(month).values())
+            yield from polls
+
+
+class JsonVoteStorage:
+    """
+    Формат votes.json, но файл читается один раз при старте:
+    все чтения идут из памяти, изменения сбрасываются на диск пачкой.
+
+    flush_mode:
+      - "sync"     — запись после каждого изменения;
+      - "confirm"  — сразу после создания, подтверждения и закрытия опроса,
+                     черновики — по таймеру;
+      - "periodic" — только по таймеру или после flush_every изменений.
+
+    Если передан archive (PollArchive), закрытые опросы переносятся туда
+    при закрытии и в файле остаются только открытые. Чтения по poll_id
+    прозрачно достают опрос из архива; индексы по времени и чатам
+    содержат и архивные опросы (только id).
+    """
+
+    def __init__(self, path, flush_mode="confirm", flush_interval=2.0, flush_every=100, archive=None):
+        self.path = Path(path)
+        self._archive = archive
+        self.flush_mode = flush_mode
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._state = self._load_state()
+        self._state.setdefault("polls", {})
+        # poll_id -> [{user_id: None} по каждому варианту] (упорядоченные множества)
+        self._voters = {
+            poll_id: self._build_voters(poll) for poll_id, poll in self._state["polls"].items()
+        }
+        # Индексы: (created_at, poll_id) по возрастанию — всего и по чатам;
+        # множество открытых опросов
+        self._by_created = []
+        self._by_chat = {}
+        self._open = set()
+        for poll in self._state["polls"].values():
+            self._index(poll)
+        if archive is not None:
+            for poll_id, created_at, chat_id in archive.entries():
+                if poll_id not in self._state["polls"]:
+                    self._index({"poll_id": poll_id, "created_at": created_at, "chat_id": chat_id, "closed": True})
+        self._dirty = set()
+        self._pending = 0
+        self._flusher = None
+        self._stop = threading.Event()
+        self.flush_count = 0
+        atexit.register(self.close)
+
+    def _load_state(self):
+        if not self.path.exists():
+            return {"polls": {}}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {"polls": {}}
+
+    def _index(self, poll):
+        key = (poll.get("created_at", 0), poll["poll_id"])
+        bisect.insort(self._by_created, key)
+        bisect.insort(self._by_chat.setdefault(poll.get("chat_id"), []), key)
+        if not poll.get("closed"):
+            self._open.add(poll["poll_id"])
+
+    def _unindex(self, poll):
+        key = (poll.get("created_at", 0), poll["poll_id"])
+        for keys in (self._by_created, self._by_chat.get(poll.get("chat_id"), [])):
+            pos = bisect.bisect_left(keys, key)
+            if pos < len(keys) and keys[pos] == key:
+                del keys[pos]
+        if not self._by_chat.get(poll.get("chat_id"), True):
+            del self._by_chat[poll.get("chat_id")]
+        self._open.discard(poll["poll_id"])
+
+    @staticmethod
+    def _build_voters(poll):
+        return [dict.fromkeys(voters) for voters in tally_voters(poll)]
+
+    def _start_flusher(self):
+        if self._flusher is not None or self.flush_mode == "sync":
+            return
+
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+
+        self._flusher = threading.Thread(target=run, name="votes-flusher", daemon=True)
+        self._flusher.start()
+
+    def _mark_dirty(self, poll_id, important=False):
+        """
+        Вызывается под _lock. Возвращает True, если файл нужно записать
+        сразу: flush() вызывающий делает уже после выхода из _lock, чтобы
+        запись на диск не держала чтения других опросов.
+        """
+        self._dirty.add(poll_id)
+        self._pending += 1
+        if (
+            self.flush_mode == "sync"
+            or (important and self.flush_mode == "confirm")
+            or self._pending >= self.flush_every
+        ):
+            return True
+        self._start_flusher()
+        return False
+
+    def flush(self):
+        """
+        Записывает состояние на диск, если есть несохранённые изменения.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                text = json.dumps(self._state, indent=2, sort_keys=True, ensure_ascii=True)
+                self._dirty.clear()
+                self._pending = 0
+            _atomic_write(self.path, text)
+            self.flush_count += 1
+
+    def _update_poll(self, poll_id, mutate, important=False):
+        with self._lock:
+            poll = self._state["polls"].get(poll_id)
+            if not poll:
+                return None
+            mutate(poll)
+            flush_now = self._mark_dirty(poll_id, important)
+        if flush_now:
+            self.flush()
+        return poll
+
+    def create_poll(self, poll):
+        with self._lock:
+            previous = self._state["polls"].get(poll["poll_id"])
+            if previous:
+                self._unindex(previous)
+            self._state["polls"][poll["poll_id"]] = poll
+            self._voters[poll["poll_id"]] = self._build_voters(poll)
+            self._index(poll)
+            flush_now = self._mark_dirty(poll["poll_id"], important=True)
+        if flush_now:
+            self.flush()
+
+    def _archived(self, poll_id):
+        if self._archive is None:
+            return None
+        poll = self._archive.get(poll_id)
+        if poll:
+            poll["tallies"] = tally_voters(poll)
+        return poll
+
+    def get_poll(self, poll_id):
+        with self._lock:
+            poll = self._state["polls"].get(poll_id)
+            if poll:
+                return dict(poll)
+        return self._archived(poll_id)
+
+    def get_poll_details(self, poll_id):
+        with self._lock:
+            poll = self._state["polls"].get(poll_id)
+            if poll:
+                details = dict(poll)
+                for key in ("votes", "users", "drafts", "confirmed"):
+                    details[key] = dict(poll.get(key, {}))
+                details["tallies"] = [list(voters) for voters in self._voters.get(poll_id, [])]
+                return details
+        return self._archived(poll_id)
+
+    def get_tallies(self, poll_id):
+        with self._lock:
+            voters = self._voters.get(poll_id)
+            if voters is not None:
+                return [len(option_voters) for option_voters in voters]
+        poll = self._archived(poll_id)
+        return [len(option_voters) for option_voters in poll["tallies"]] if poll else []
+
+    def get_ballot(self, poll_id, user_id):
+        with self._lock:
+            poll = self._state["polls"].get(poll_id) or {}
+            draft = list(poll.get("drafts", {}).get(user_id, []))
+            return draft, bool(poll.get("confirmed", {}).get(user_id))
+
+    def save_draft(self, poll_id, user_id, selections, user_info):
+        def mutate(poll):
+            poll.setdefault("drafts", {})[user_id] = list(selections)
+            poll.setdefault("users", {})[user_id] = user_info
+        self._update_poll(poll_id, mutate)
+
+    def confirm_vote(self, poll_id, user_id, selections, user_info):
+        def mutate(poll):
+            votes = poll.setdefault("votes", {})
+            voters = self._voters.setdefault(poll_id, [{} for _ in poll["options"]])
+            for option_idx in _selections(votes.get(user_id, [])):
+                if 0 <= option_idx < len(voters):
+                    voters[option_idx].pop(user_id, None)
+            for option_idx in selections:
+                if 0 <= option_idx < len(voters):
+                    voters[option_idx][user_id] = None
+            votes[user_id] = list(selections)
+            poll.setdefault("confirmed", {})[user_id] = True
+            poll.setdefault("users", {})[user_id] = user_info
+        self._update_poll(poll_id, mutate, important=True)
+
+    def close_poll(self, poll_id):
+        with self._lock:
+            poll = self._state["polls"].get(poll_id)
+            if not poll:
+                return
+            poll["closed"] = True
+            self._open.discard(poll_id)
+            if self._archive is not None:
+                self._archive_poll(poll_id)
+            flush_now = self._mark_dirty(poll_id, important=True)
+        if flush_now:
+            self.flush()
+
+    def _archive_poll(self, poll_id):
+        # Сначала архив, потом votes.json: при сбое между ними опрос
+        # окажется в обоих местах, а не потеряется
+        poll = self._state["polls"][poll_id]
+        self._archive.add(poll)
+        del self._state["polls"][poll_id]
+        self._voters.pop(poll_id, None)
+
+    def archive_closed_polls(self):
+        """
+        Переносит в архив все закрытые опросы из votes.json
+        (однократно для файлов, накопленных до появления архива).
+        """
+        if self._archive is None:
+            return 0
+        with self._lock:
+            closed = [poll_id for poll_id, poll in self._state["polls"].items() if poll.get("closed")]
+            for poll_id in closed:
+                self._archive_poll(poll_id)
+            if closed:
+                self._mark_dirty(closed[0], important=True)
+        if closed:
+            self.flush()
+        return len(closed)
+
+    def has_polls(self):
+        with self._lock:
+            return bool(self._by_created)
+
+    def find_latest_poll(self, chat_id=None):
+        with self._lock:
+            keys = self._by_created if chat_id is None else self._by_chat.get(chat_id)
+            if not keys:
+                return None
+            poll_id = keys[-1][1]
+            poll = self._state["polls"].get(poll_id)
+            if poll:
+                return dict(poll)
+        return self._archived(poll_id)
+
+    def find_open_polls(self, chat_id=None):
+        """
+        Незакрытые опросы (без голосов), от новых к старым.
+        """
+        with self._lock:
+            polls = [
+                self._state["polls"][poll_id] for poll_id in self._open
+                if chat_id is None or self._state["polls"][poll_id].get("chat_id") == chat_id
+            ]
+            polls.sort(key=lambda p: (p.get("created_at", 0), p["poll_id"]), reverse=True)
+            return [dict(poll) for poll in polls]
+
+    def iter_polls(self):
+        with self._lock:
+            polls = [self.get_poll_details(poll_id) for poll_id in self._state["polls"]]
+        if self._archive is not None:
+            hot = {poll["poll_id"] for poll in polls}
+            polls.extend(poll for poll in self._archive.iter_polls() if poll["poll_id"] not in hot)
+        return iter(polls)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS polls (
+    poll_id TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    chat_id INTEGER,
+    message_id INTEGER,
+    created_at INTEGER NOT NULL,
+    end_at INTEGER NOT NULL,
+    closed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS polls_chat_created ON polls (chat_id, created_at);
+CREATE INDEX IF NOT EXISTS polls_created ON polls (created_at);
+CREATE INDEX IF NOT EXISTS polls_open ON polls (created_at) WHERE closed = 0;
+
+CREATE TABLE IF NOT EXISTS options (
+    poll_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (poll_id, idx)
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    poll_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    username TEXT,
+    name TEXT,
+    PRIMARY KEY (poll_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS drafts (
+    poll_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    selections TEXT NOT NULL,
+    PRIMARY KEY (poll_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS votes (
+    poll_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    option_idx INTEGER NOT NULL,
+    PRIMARY KEY (poll_id, user_id, option_idx)
+);
+CREATE INDEX IF NOT EXISTS votes_option ON votes (poll_id, option_idx);
+
+CREATE TABLE IF NOT EXISTS tallies (
+    poll_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (poll_id, idx)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SqliteVoteStorage:
+    """
+    SQLite в режиме WAL: каждый клик — одна короткая транзакция
+    по индексированным строкам, независимо от числа старых опросов.
+    У каждого потока своё соединение.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if not self.get_meta("tallies_built"):
+            self.rebuild_tallies()
+
+    def rebuild_tallies(self):
+        """
+        Пересчитывает счётчики по вариантам из таблицы votes
+        (один раз для баз, созданных до появления счётчиков).
+        """
+        self._write([
+            ("DELETE FROM tallies", ()),
+            (
+                "INSERT INTO tallies (poll_id, idx, count) "
+                "SELECT poll_id, option_idx, COUNT(*) FROM votes GROUP BY poll_id, option_idx",
+                (),
+            ),
+            ("INSERT OR REPLACE INTO meta (key, value) VALUES ('tallies_built', '1')", ()),
+        ])
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, statements):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _user_statement(poll_id, user_id, user_info):
+        return (
+            "INSERT INTO users (poll_id, user_id, username, name) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (poll_id, user_id) DO UPDATE SET "
+            "username = excluded.username, name = excluded.name",
+            (poll_id, user_id, user_info.get("username"), user_info.get("name")),
+        )
+
+    def _poll_row_to_dict(self, row):
+        poll_id, question, chat_id, message_id, created_at, end_at, closed = row
+        options = [
+            text for (text,) in self._conn().execute(
+                "SELECT text FROM options WHERE poll_id = ? ORDER BY idx", (poll_id,)
+            )
+        ]
+        return {
+            "poll_id": poll_id,
+            "question": question,
+            "options": options,
+            "created_at": created_at,
+            "end_at": end_at,
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "closed": bool(closed),
+        }
+
+    def _select_poll(self, where, params):
+        row = self._conn().execute(
+            "SELECT poll_id, question, chat_id, message_id, created_at, end_at, closed "
+            f"FROM polls {where}",
+            params,
+        ).fetchone()
+        return self._poll_row_to_dict(row) if row else None
+
+    def create_poll(self, poll):
+        poll_id = poll["poll_id"]
+        statements = [(
+            "INSERT OR REPLACE INTO polls "
+            "(poll_id, question, chat_id, message_id, created_at, end_at, closed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                poll_id, poll["question"], poll.get("chat_id"), poll.get("message_id"),
+                poll.get("created_at", 0), poll["end_at"], int(bool(poll.get("closed"))),
+            ),
+        )]
+        for idx, text in enumerate(poll["options"]):
+            statements.append((
+                "INSERT OR REPLACE INTO options (poll_id, idx, text) VALUES (?, ?, ?)",
+                (poll_id, idx, text),
+            ))
+        for user_id, info in poll.get("users", {}).items():
+            statements.append(self._user_statement(poll_id, user_id, info or {}))
+        for user_id, selections in poll.get("drafts", {}).items():
+            statements.append((
+                "INSERT OR REPLACE INTO drafts (poll_id, user_id, selections) VALUES (?, ?, ?)",
+                (poll_id, user_id, json.dumps(list(selections))),
+            ))
+        statements.append(("DELETE FROM tallies WHERE poll_id = ?", (poll_id,)))
+        for option_idx, voters in enumerate(tally_voters(poll)):
+            for user_id in voters:
+                statements.append((
+                    "INSERT OR IGNORE INTO votes (poll_id, user_id, option_idx) VALUES (?, ?, ?)",
+                    (poll_id, user_id, option_idx),
+                ))
+            statements.append((
+                "INSERT INTO tallies (poll_id, idx, count) VALUES (?, ?, ?)",
+                (poll_id, option_idx, len(voters)),
+            ))
+        self._write(statements)
+
+    def get_poll(self, poll_id):
+        return self._select_poll("WHERE poll_id = ?", (poll_id,))
+
+    def get_poll_details(self, poll_id):
+        poll = self.get_poll(poll_id)
+        if not poll:
+            return None
+        conn = self._conn()
+        votes = {}
+        tallies = [[] for _ in poll["options"]]
+        for user_id, option_idx in conn.execute(
+            "SELECT user_id, option_idx FROM votes WHERE poll_id = ? ORDER BY user_id, option_idx",
+            (poll_id,),
+        ):
+            votes.setdefault(user_id, []).append(option_idx)
+            if 0 <= option_idx < len(tallies):
+                tallies[option_idx].append(user_id)
+        poll["votes"] = votes
+        poll["tallies"] = tallies
+        poll["confirmed"] = {user_id: True for user_id in votes}
+        poll["drafts"] = {
+            user_id: json.loads(selections)
+            for user_id, selections in conn.execute(
+                "SELECT user_id, selections FROM drafts WHERE poll_id = ?", (poll_id,)
+            )
+        }
+        poll["users"] = {
+            user_id: {"username": username, "name": name}
+            for user_id, username, name in conn.execute(
+                "SELECT user_id, username, name FROM users WHERE poll_id = ?", (poll_id,)
+            )
+        }
+        return poll
+
+    def get_tallies(self, poll_id):
+        return [
+            count for _idx, count in self._conn().execute(
+                "SELECT o.idx, COALESCE(t.count, 0) FROM options o "
+                "LEFT JOIN tallies t ON t.poll_id = o.poll_id AND t.idx = o.idx "
+                "WHERE o.poll_id = ? ORDER BY o.idx",
+                (poll_id,),
+            )
+        ]
+
+    def get_ballot(self, poll_id, user_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT selections FROM drafts WHERE poll_id = ? AND user_id = ?",
+            (poll_id, user_id),
+        ).fetchone()
+        draft = json.loads(row[0]) if row else []
+        confirmed = conn.execute(
+            "SELECT 1 FROM votes WHERE poll_id = ? AND user_id = ? LIMIT 1",
+            (poll_id, user_id),
+        ).fetchone() is not None
+        return draft, confirmed
+
+    def save_draft(self, poll_id, user_id, selections, user_info):
+        self._write([
+            (
+                "INSERT INTO drafts (poll_id, user_id, selections) VALUES (?, ?, ?) "
+                "ON CONFLICT (poll_id, user_id) DO UPDATE SET selections = excluded.selections",
+                (poll_id, user_id, json.dumps(list(selections))),
+            ),
+            self._user_statement(poll_id, user_id, user_info),
+        ])
+
+    def confirm_vote(self, poll_id, user_id, selections, user_info):
+        # Счётчики меняются в той же транзакции, что и голоса
+        statements = [
+            (
+                "UPDATE tallies SET count = count - 1 WHERE poll_id = ? AND idx IN "
+                "(SELECT option_idx FROM votes WHERE poll_id = ? AND user_id = ?)",
+                (poll_id, poll_id, user_id),
+            ),
+            ("DELETE FROM votes WHERE poll_id = ? AND user_id = ?", (poll_id, user_id)),
+            self._user_statement(poll_id, user_id, user_info),
+        ]
+        for option_idx in dict.fromkeys(selections):
+            statements.append((
+                "INSERT INTO votes (poll_id, user_id, option_idx) VALUES (?, ?, ?)",
+                (poll_id, user_id, option_idx),
+            ))
+            statements.append((
+                "INSERT INTO tallies (poll_id, idx, count) VALUES (?, ?, 1) "
+                "ON CONFLICT (poll_id, idx) DO UPDATE SET count = count + 1",
+                (poll_id, option_idx),
+            ))
+        self._write(statements)
+
+    def close_poll(self, poll_id):
+        self._write([("UPDATE polls SET closed = 1 WHERE poll_id = ?", (poll_id,))])
+
+    def has_polls(self):
+        return self._conn().execute("SELECT 1 FROM polls LIMIT 1").fetchone() is not None
+
+    def find_latest_poll(self, chat_id=None):
+        if chat_id is None:
+            return self._select_poll("ORDER BY created_at DESC LIMIT 1", ())
+        return self._select_poll(
+            "WHERE chat_id = ? ORDER BY created_at DESC LIMIT 1", (chat_id,)
+        )
+
+    def find_open_polls(self, chat_id=None):
+        columns = "poll_id, question, chat_id, message_id, created_at, end_at, closed"
+        if chat_id is None:
+            rows = self._conn().execute(
+                f"SELECT {columns} FROM polls WHERE closed = 0 ORDER BY created_at DESC"
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                f"SELECT {columns} FROM polls WHERE closed = 0 AND chat_id = ? ORDER BY created_at DESC",
+                (chat_id,),
+            ).fetchall()
+        return [self._poll_row_to_dict(row) for row in rows]
+
+    def iter_polls(self):
+        for (poll_id,) in self._conn().execute("SELECT poll_id FROM polls").fetchall():
+            yield self.get_poll_details(poll_id)
+
+    def get_meta(self, key):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self._write([("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))])
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ========================================================================
+#                     ПЕРЕНОС ИЗ votes.json В SQLite
+# ========================================================================
+
+def migrate_json_to_sqlite(json_path, storage, logger=None):
+    """
+    Однократно переносит все опросы из votes.json в SQLite.
+    Повторный запуск ничего не делает (отметка в таблице meta).
+    Исходный файл не изменяется.
+    """
+    if storage.get_meta("migrated_from_json"):
+        return 0
+    archive = PollArchive(VOTES_ARCHIVE_DIR) if Path(VOTES_ARCHIVE_DIR).exists() else None
+    source = JsonVoteStorage(json_path, archive=archive)
+    count = 0
+    for poll in source.iter_polls():
+        storage.create_poll(poll)
+        count += 1
+    storage.set_meta("migrated_from_json", str(json_path))
+    if logger:
+        logger.info(f"Migrated {count} poll(s) from {json_path} to SQLite")
+    return count
+
+
+def create_vote_storage(logger=None):
+    if VOTES_BACKEND == "sqlite":
+        storage = SqliteVoteStorage(VOTES_DB_PATH)
+        if Path(VOTES_JSON_PATH).exists():
+            migrate_json_to_sqlite(VOTES_JSON_PATH, storage, logger=logger)
+        return storage
+    storage = JsonVoteStorage(
+        VOTES_JSON_PATH,
+        flush_mode=VOTES_FLUSH_MODE,
+        flush_interval=VOTES_FLUSH_INTERVAL,
+        flush_every=VOTES_FLUSH_EVERY,
+        archive=PollArchive(VOTES_ARCHIVE_DIR) if VOTES_ARCHIVE else None,
+    )
+    archived = storage.archive_closed_polls()
+    if archived and logger:
+        logger.info(f"Archived {archived} closed poll(s) to {VOTES_ARCHIVE_DIR}")
+    return storage
+
+
+if __name__ == "__main__":
+    # python vote_storage.py migrate [votes.json] [votes.db]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python vote_storage.py migrate [JSON_PATH] [DB_PATH]")
+        sys.exit(1)
+    json_path = sys.argv[2] if len(sys.argv) > 2 else VOTES_JSON_PATH
+    db_path = sys.argv[3] if len(sys.argv) > 3 else VOTES_DB_PATH
+    migrated = migrate_json_to_sqlite(json_path, SqliteVoteStorage(db_path))
+    print(f"Migrated {migrated} poll(s) from {json_path} to {db_path}")
@@ -1,30 +1,25 @@
-import json
 import time
 import uuid
 from datetime import datetime, timezone
-from pathlib import Path
 
 from telebot import types
 
+from config import VOTES_LIVE_RESULTS, VOTES_LIVE_INTERVAL, VOTES_EXPIRY_ACTION
+from live_results import LiveResultsUpdater
+from metrics import registry, timed
+from profiling import phase
+from outbox import BULK
+from poll_expiry import PollExpiryScheduler
+from poll_locks import PollLockManager
+from router import CallbackRouter
+from subscription import check_subscriptions
+from vote_storage import create_vote_storage, tally_voters
 
-DATA_PATH = Path(__file__).resolve().parents[1] / "votes.json"
-DEFAULT_DURATION_SECONDS = 7 * 24 * 60 * 60
-
-
-def _load_state():
-    if not DATA_PATH.exists():
-        return {"polls": {}}
-    try:
-        with DATA_PATH.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"polls": {}}
 
+DEFAULT_DURATION_SECONDS = 7 * 24 * 60 * 60
+SUBSCRIBED_FLAG = "subscribed"
 
-def _save_state(state):
-    DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with DATA_PATH.open("w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2, sort_keys=True, ensure_ascii=True)
+poll_locks = PollLockManager()
 
 
 def _now_ts():
@@ -102,25 +97,128 @@ def _format_user(info, user_id):
     return str(user_id)
 
 
+def _user_info(user):
+    return {
+        "username": user.username,
+        "name": " ".join(filter(None, [user.first_name, user.last_name])).strip(),
+    }
+
+
+def _parse_poll_selector(text):
+    parts = (text or "").split()
+    poll_id = parts[1] if len(parts) > 1 else None
+    channel_id_override = None
+    if len(parts) > 2 and parts[1].lower() == "channel":
+        try:
+            channel_id_override = int(parts[2])
+        except Exception:
+            channel_id_override = None
+    return poll_id, channel_id_override
+
+
+def _pop_flag(text, flag):
+    """
+    Убирает из команды слово-флаг (в любом месте после команды).
+    """
+    parts = (text or "").split()
+    rest = [part for part in parts[1:] if part.lower() != flag]
+    return " ".join(parts[:1] + rest), len(rest) != len(parts) - 1
+
+
+def _only_voters(poll, allowed):
+    """
+    Копия опроса, в которой остались только пользователи из allowed.
+    """
+    filtered = dict(poll)
+    filtered.pop("tallies", None)
+    for key in ("votes", "users", "drafts", "confirmed"):
+        filtered[key] = {
+            user_id: value for user_id, value in poll.get(key, {}).items() if user_id in allowed
+        }
+    return filtered
+
+
+def _find_poll(bot, message, storage, poll_id, channel_id_override):
+    if not storage.has_polls():
+        bot.send_message(message.chat.id, "No polls found.")
+        return None
+
+    if not poll_id or (poll_id.lower() == "channel" and channel_id_override is not None):
+        latest = storage.find_latest_poll(channel_id_override)
+        if not latest:
+            bot.send_message(message.chat.id, "No polls found for that channel.")
+            return None
+        poll_id = latest["poll_id"]
+
+    poll = storage.get_poll_details(poll_id)
+    if not poll:
+        bot.send_message(message.chat.id, f"Poll not found: {poll_id}")
+        return None
+    return poll
+
+
+def _poll_markup(poll_id, options):
+    markup = types.InlineKeyboardMarkup()
+    for idx, option in enumerate(options):
+        markup.add(
+            types.InlineKeyboardButton(
+                option,
+                callback_data=f"vote:{poll_id}:{idx}"
+            )
+        )
+    markup.add(
+        types.InlineKeyboardButton(
+            "Подтвердить ✅",
+            callback_data=f"vote_confirm:{poll_id}"
+        )
+    )
+    return markup
+
+
+def _poll_text(question, end_at, options=None, counts=None):
+    text_lines = [
+        question,
+        "",
+        "Выберите, затем нажмите кнопку Подтвердить ✅.",
+        "",
+        "Кончается: " + _format_end_date(end_at),
+    ]
+    if counts is not None:
+        text_lines.append("")
+        text_lines.append("Текущие результаты:")
+        for idx, option in enumerate(options):
+            count = counts[idx] if idx < len(counts) else 0
+            text_lines.append(f"{option} — {count}")
+    return "\n".join(text_lines)
+
+
+def _render_live(poll, counts):
+    text = _poll_text(poll["question"], poll["end_at"], poll["options"], counts)
+    return text, _poll_markup(poll["poll_id"], poll["options"])
+
+
+def _final_poll_text(poll, counts):
+    lines = [poll["question"], "", "Опрос завершён. Итоги:"]
+    for idx, option in enumerate(poll["options"]):
+        count = counts[idx] if idx < len(counts) else 0
+        lines.append(f"{option} — {count}")
+    return "\n".join(lines)
+
+
 def _build_results_text(poll):
     lines = []
     lines.append(f"Poll ID: {poll['poll_id']}")
     lines.append(f"Question: {poll['question']}")
     lines.append(f"Ends at: {_format_end_time(poll['end_at'])}")
     lines.append("")
-    votes = poll.get("votes", {})
     users = poll.get("users", {})
+    # Хранилище отдаёт готовые списки по вариантам; иначе — один проход по голосам
+    tallies = poll.get("tallies")
+    if tallies is None:
+        tallies = tally_voters(poll)
     for idx, option in enumerate(poll["options"]):
-        voters = []
-        for user_id, opt_idx in votes.items():
-            selected = opt_idx
-            if isinstance(opt_idx, list):
-                selected = idx in opt_idx
-            else:
-                selected = opt_idx == idx
-            if selected:
-                info = users.get(user_id, {})
-                voters.append(_format_user(info, user_id))
+        voter_ids = tallies[idx] if idx < len(tallies) else []
+        voters = [_format_user(users.get(user_id, {}), user_id) for user_id in voter_ids]
         lines.append(f"{idx + 1}. {option} - {len(voters)} vote(s)")
         for voter in voters:
             lines.append(f"- {voter}")
@@ -130,8 +228,66 @@ def _build_results_text(poll):
     return "\n".join(lines).strip()
 
 
-def register_voting_handlers(bot, logger, admin_id, channel_id):
+def register_voting_handlers(bot, logger, admin_id, channel_id, storage=None, router=None):
+    """
+    Кнопки опросов (vote:, vote_confirm:) регистрируются в router — общем
+    роутере callback'ов бота. Без него создаётся свой роутер со своим
+    обработчиком callback_query.
+    """
+    if storage is None:
+        storage = create_vote_storage(logger)
+    if router is None:
+        router = CallbackRouter(logger)
+        bot.callback_query_handler(func=lambda call: router.resolve(call.data) is not None)(router.dispatch)
+    live = None
+    if VOTES_LIVE_RESULTS:
+        live = LiveResultsUpdater(
+            bot, storage, _render_live, logger, interval=VOTES_LIVE_INTERVAL, locks=poll_locks
+        )
+        registry.add_collector("live_results", live.stats)
+
+    def _finalize_poll(poll_id):
+        """
+        Убирает кнопки у закрытого опроса и, если настроено, показывает итоги:
+        VOTES_EXPIRY_ACTION=edit — в самом сообщении, post — ответом на него,
+        none — только убрать кнопки.
+        """
+        poll = storage.get_poll(poll_id)
+        if not poll or not poll.get("message_id"):
+            return
+        if live is not None:
+            live.forget(poll_id)
+        chat_id = poll["chat_id"]
+        message_id = poll["message_id"]
+        if VOTES_EXPIRY_ACTION == "edit":
+            bot.edit_message_text(
+                _final_poll_text(poll, storage.get_tallies(poll_id)),
+                chat_id=chat_id, message_id=message_id, priority=BULK
+            )
+            return
+        bot.edit_message_reply_markup(chat_id, message_id, priority=BULK)
+        if VOTES_EXPIRY_ACTION == "post":
+            bot.send_message(
+                chat_id, _final_poll_text(poll, storage.get_tallies(poll_id)),
+                reply_to_message_id=message_id, priority=BULK
+            )
+
+    def _expire_poll(poll_id):
+        with poll_locks.hold(poll_id):
+            poll = storage.get_poll(poll_id)
+            if not poll or poll.get("closed"):
+                return
+            storage.close_poll(poll_id)
+        logger.info(f"Poll {poll_id} closed by schedule")
+        _finalize_poll(poll_id)
+
+    expiry = PollExpiryScheduler(storage, _expire_poll, logger)
+    expiry.start()
+    registry.add_collector("poll_expiry", expiry.stats)
+    registry.add_collector("poll_locks", poll_locks.stats)
+
     @bot.message_handler(commands=["help"])
+    @timed("/help")
     def handle_help(message):
         user = message.from_user
         if not _is_admin(user.id, admin_id):
@@ -148,12 +304,16 @@ def register_voting_handlers(bot, logger, admin_id, channel_id):
             "/vote_participants\n"
             "/vote_participants POLL_ID\n"
             "/vote_participants channel CHANNEL_ID\n"
+            "/vote_results ... subscribed — только подписчики канала\n"
+            "/vote_participants ... subscribed\n"
             "/vote_close POLL_ID\n"
             "/vote_close channel CHANNEL_ID\n"
+            "/slow — самые медленные обработчики (PROFILE_ENABLED)\n"
         )
         bot.send_message(message.chat.id, help_text)
 
     @bot.message_handler(commands=["vote"])
+    @timed("/vote")
     def handle_vote_command(message):
         user = message.from_user
         if not _is_admin(user.id, admin_id):
@@ -184,35 +344,12 @@ def register_voting_handlers(bot, logger, admin_id, channel_id):
         poll_id = uuid.uuid4().hex[:8]
         end_at = _now_ts() + DEFAULT_DURATION_SECONDS
 
-        markup = types.InlineKeyboardMarkup()
-        for idx, option in enumerate(options):
-            markup.add(
-                types.InlineKeyboardButton(
-                    option,
-                    callback_data=f"vote:{poll_id}:{idx}"
-                )
-            )
-
-        text_lines = [
-            question,
-            "",
-            "Выберите, затем нажмите кнопку Подтвердить ✅.",
-            "",
-            "Кончается: " + _format_end_date(end_at),
-        ]
-        text = "\n".join(text_lines)
+        markup = _poll_markup(poll_id, options)
+        text = _poll_text(question, end_at)
 
-        markup.add(
-            types.InlineKeyboardButton(
-                "Подтвердить ✅",
-                callback_data=f"vote_confirm:{poll_id}"
-            )
-        )
+        message_out = bot.send_message(target_chat_id, text, reply_markup=markup, priority=BULK)
 
-        message_out = bot.send_message(target_chat_id, text, reply_markup=markup)
-
-        state = _load_state()
-        state["polls"][poll_id] = {
+        storage.create_poll({
             "poll_id": poll_id,
             "question": question,
             "options": options,
@@ -225,8 +362,8 @@ def register_voting_handlers(bot, logger, admin_id, channel_id):
             "drafts": {},
             "confirmed": {},
             "closed": False,
-        }
-        _save_state(state)
+        })
+        expiry.schedule(poll_id, end_at)
         logger.info(f"Created poll {poll_id} in chat {target_chat_id}")
         if message.chat.id != target_chat_id:
             bot.send_message(
@@ -234,103 +371,63 @@ def register_voting_handlers(bot, logger, admin_id, channel_id):
                 f"Poll created in channel. Poll ID: {poll_id}"
             )
 
+    def _subscribed_only(message, poll, user_ids):
+        """
+        Оставляет в опросе только тех, кто сейчас подписан на канал.
+        Возвращает (опрос, строка-пояснение).
+        """
+        if len(user_ids) > 50:
+            bot.send_message(message.chat.id, f"Проверяю подписку {len(user_ids)} участников…")
+        statuses = check_subscriptions(bot, channel_id, user_ids, logger=logger)
+        allowed = {user_id for user_id, subscribed in statuses.items() if subscribed}
+        note = f"Только подписчики канала: {len(allowed)} из {len(user_ids)}"
+        unknown = sum(1 for subscribed in statuses.values() if subscribed is None)
+        if unknown:
+            note += f" (не удалось проверить: {unknown})"
+        return _only_voters(poll, allowed), note
+
     @bot.message_handler(commands=["vote_results"])
+    @timed("/vote_results")
     def handle_vote_results(message):
         user = message.from_user
         if not _is_admin(user.id, admin_id):
             return
 
-        parts = (message.text or "").split()
-        poll_id = parts[1] if len(parts) > 1 else None
-        channel_id_override = None
-        if len(parts) > 2 and parts[1].lower() == "channel":
-            try:
-                channel_id_override = int(parts[2])
-            except Exception:
-                channel_id_override = None
-
-        state = _load_state()
-        polls = state.get("polls", {})
-        if not polls:
-            bot.send_message(message.chat.id, "No polls found.")
-            return
-
-        if not poll_id:
-            candidates = list(polls.values())
-            if channel_id_override is not None:
-                candidates = [
-                    poll for poll in candidates
-                    if poll.get("chat_id") == channel_id_override
-                ]
-            if not candidates:
-                bot.send_message(message.chat.id, "No polls found for that channel.")
-                return
-            poll_id = max(candidates, key=lambda p: p.get("created_at", 0))["poll_id"]
-        elif poll_id and poll_id.lower() == "channel" and channel_id_override is not None:
-            candidates = [
-                poll for poll in polls.values()
-                if poll.get("chat_id") == channel_id_override
-            ]
-            if not candidates:
-                bot.send_message(message.chat.id, "No polls found for that channel.")
-                return
-            poll_id = max(candidates, key=lambda p: p.get("created_at", 0))["poll_id"]
-
-        poll = polls.get(poll_id)
+        text, only_subscribed = _pop_flag(message.text, SUBSCRIBED_FLAG)
+        poll_id, channel_id_override = _parse_poll_selector(text)
+        with phase("load_poll"):
+            poll = _find_poll(bot, message, storage, poll_id, channel_id_override)
         if not poll:
-            bot.send_message(message.chat.id, f"Poll not found: {poll_id}")
             return
 
+        note = None
+        if only_subscribed:
+            poll, note = _subscribed_only(message, poll, list(poll.get("votes", {})))
+
         results_text = _build_results_text(poll)
+        if note:
+            results_text += "\n\n" + note
         bot.send_message(message.chat.id, results_text)
 
     @bot.message_handler(commands=["vote_participants"])
+    @timed("/vote_participants")
     def handle_vote_participants(message):
         user = message.from_user
         if not _is_admin(user.id, admin_id):
             return
 
-        parts = (message.text or "").split()
-        poll_id = parts[1] if len(parts) > 1 else None
-        channel_id_override = None
-        if len(parts) > 2 and parts[1].lower() == "channel":
-            try:
-                channel_id_override = int(parts[2])
-            except Exception:
-                channel_id_override = None
-
-        state = _load_state()
-        polls = state.get("polls", {})
-        if not polls:
-            bot.send_message(message.chat.id, "No polls found.")
-            return
-
-        if not poll_id:
-            candidates = list(polls.values())
-            if channel_id_override is not None:
-                candidates = [
-                    poll for poll in candidates
-                    if poll.get("chat_id") == channel_id_override
-                ]
-            if not candidates:
-                bot.send_message(message.chat.id, "No polls found for that channel.")
-                return
-            poll_id = max(candidates, key=lambda p: p.get("created_at", 0))["poll_id"]
-        elif poll_id and poll_id.lower() == "channel" and channel_id_override is not None:
-            candidates = [
-                poll for poll in polls.values()
-                if poll.get("chat_id") == channel_id_override
-            ]
-            if not candidates:
-                bot.send_message(message.chat.id, "No polls found for that channel.")
-                return
-            poll_id = max(candidates, key=lambda p: p.get("created_at", 0))["poll_id"]
-
-        poll = polls.get(poll_id)
+        text, only_subscribed = _pop_flag(message.text, SUBSCRIBED_FLAG)
+        poll_id, channel_id_override = _parse_poll_selector(text)
+        with phase("load_poll"):
+            poll = _find_poll(bot, message, storage, poll_id, channel_id_override)
         if not poll:
-            bot.send_message(message.chat.id, f"Poll not found: {poll_id}")
             return
 
+        note = None
+        if only_subscribed:
+            confirmed_ids = [user_id for user_id, done in poll.get("confirmed", {}).items() if done]
+            poll, note = _subscribed_only(message, poll, confirmed_ids)
+
         users = poll.get("users", {})
         confirmed = poll.get("confirmed", {})
         confirmed_users = [
@@ -339,13 +436,16 @@ def register_voting_handlers(bot, logger, admin_id, channel_id):
             if confirmed.get(user_id)
         ]
         if not confirmed_users:
-            bot.send_message(message.chat.id, "No participants yet.")
+            bot.send_message(message.chat.id, "\n\n".join(filter(None, ["No participants yet.", note])))
             return
 
         text = "Участники:\n" + "\n".join(sorted(confirmed_users))
+        if note:
+            text += "\n\n" + note
         bot.send_message(message.chat.id, text)
 
     @bot.message_handler(commands=["vote_close"])
+    @timed("/vote_close")
     def handle_vote_close(message):
         user = message.from_user
         if not _is_admin(user.id, admin_id):
@@ -368,121 +468,126 @@ def register_voting_handlers(bot, logger, admin_id, channel_id):
             except Exception:
                 channel_id_override = None
             poll_id = None
-        state = _load_state()
         if poll_id is None:
-            candidates = [
-                poll for poll in state.get("polls", {}).values()
-                if poll.get("chat_id") == channel_id_override
-            ]
-            if not candidates:
+            latest = None
+            if channel_id_override is not None:
+                latest = storage.find_latest_poll(channel_id_override)
+            if not latest:
                 bot.send_message(message.chat.id, "No polls found for that channel.")
                 return
-            poll = max(candidates, key=lambda p: p.get("created_at", 0))
-        else:
-            poll = state.get("polls", {}).get(poll_id)
-        if not poll:
+            poll_id = latest["poll_id"]
+        if not storage.get_poll(poll_id):
             bot.send_message(message.chat.id, f"Poll not found: {poll_id}")
             return
 
-        poll["closed"] = True
-        state["polls"][poll_id] = poll
-        _save_state(state)
+        with poll_locks.hold(poll_id):
+            already_closed = storage.get_poll(poll_id).get("closed")
+            if not already_closed:
+                storage.close_poll(poll_id)
+                poll = storage.get_poll_details(poll_id)
+        if already_closed:
+            # Итоги уже опубликованы, повторная правка только потратит лимит канала
+            bot.send_message(message.chat.id, f"Poll already closed: {poll_id}")
+            return
+        try:
+            _finalize_poll(poll_id)
+        except Exception as e:
+            logger.warning(f"Не удалось убрать кнопки опроса {poll_id}: {e}")
 
         results_text = _build_results_text(poll)
         bot.send_message(message.chat.id, results_text)
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("vote:") or call.data.startswith("vote_confirm:"))
-    def handle_vote_callback(call):
-        if call.data.startswith("vote_confirm:"):
-            try:
-                _, poll_id = call.data.split(":", 1)
-            except Exception:
-                bot.answer_callback_query(call.id, "Invalid vote data.")
-                return
-
-            state = _load_state()
-            poll = state.get("polls", {}).get(poll_id)
-            if not poll:
-                bot.answer_callback_query(call.id, "Poll not found.")
-                return
+    def _is_closed(poll):
+        # Только проверка: закрывает опрос и публикует итоги планировщик (expiry)
+        return poll.get("closed") or _now_ts() >= poll["end_at"]
 
-            if poll.get("closed") or _now_ts() >= poll["end_at"]:
-                poll["closed"] = True
-                state["polls"][poll_id] = poll
-                _save_state(state)
-                bot.answer_callback_query(call.id, "Poll is closed.")
-                return
+    def _confirm_vote(poll_id, user):
+        poll = storage.get_poll(poll_id)
+        if not poll:
+            return "Poll not found."
 
-            user = call.from_user
-            user_id = str(user.id)
-            confirmed = poll.get("confirmed", {}).get(user_id)
-            if confirmed:
-                bot.answer_callback_query(call.id, "Вы уже проголосовали.")
-                return
+        if _is_closed(poll):
+            return "Poll is closed."
 
-            selections = poll.get("drafts", {}).get(user_id, [])
-            if not selections:
-                bot.answer_callback_query(call.id, "Выберите хотя бы один вариант.")
-                return
+        user_id = str(user.id)
+        selections, confirmed = storage.get_ballot(poll_id, user_id)
+        if confirmed:
+            return "Вы уже проголосовали."
 
-            poll.setdefault("votes", {})[user_id] = sorted(set(selections))
-            poll.setdefault("confirmed", {})[user_id] = True
-            poll.setdefault("users", {})[user_id] = {
-                "username": user.username,
-                "name": " ".join(filter(None, [user.first_name, user.last_name])).strip(),
-            }
-            state["polls"][poll_id] = poll
-            _save_state(state)
-            bot.answer_callback_query(call.id, "Ваш голос учтен.")
-            logger.info(f"Vote confirmed in poll {poll_id} from {user_id} -> {selections}")
-            return
+        if not selections:
+            return "Выберите хотя бы один вариант."
 
-        try:
-            _, poll_id, option_idx = call.data.split(":", 2)
-            option_idx = int(option_idx)
-        except Exception:
-            bot.answer_callback_query(call.id, "Invalid vote data.")
-            return
+        storage.confirm_vote(poll_id, user_id, sorted(set(selections)), _user_info(user))
+        logger.info(
+            f"Vote confirmed in poll {poll_id} from {user_id} -> {selections}",
+            extra={"event": "vote_confirm", "user_id": user.id, "action": f"vote_confirm:{poll_id}"},
+        )
+        if live is not None:
+            live.mark(poll_id)
+        return "Ваш голос учтен."
 
-        state = _load_state()
-        poll = state.get("polls", {}).get(poll_id)
+    def _toggle_option(poll_id, option_idx, user):
+        poll = storage.get_poll(poll_id)
         if not poll:
-            bot.answer_callback_query(call.id, "Poll not found.")
-            return
+            return "Poll not found."
 
-        if poll.get("closed") or _now_ts() >= poll["end_at"]:
-            poll["closed"] = True
-            state["polls"][poll_id] = poll
-            _save_state(state)
-            bot.answer_callback_query(call.id, "Poll is closed.")
-            return
+        if _is_closed(poll):
+            return "Poll is closed."
 
         if option_idx < 0 or option_idx >= len(poll["options"]):
-            bot.answer_callback_query(call.id, "Invalid option.")
-            return
+            return "Invalid option."
 
-        user = call.from_user
         user_id = str(user.id)
-        if poll.get("confirmed", {}).get(user_id):
-            bot.answer_callback_query(call.id, "Вы уже проголосовали.")
-            return
+        draft, confirmed = storage.get_ballot(poll_id, user_id)
+        if confirmed:
+            return "Вы уже проголосовали."
 
-        drafts = poll.setdefault("drafts", {})
-        selections = set(drafts.get(user_id, []))
+        selections = set(draft)
         if option_idx in selections:
             selections.remove(option_idx)
             action_text = "Убрано из выбора."
         else:
             selections.add(option_idx)
             action_text = "Добавлено в выбор."
-        drafts[user_id] = sorted(selections)
+        selections = sorted(selections)
+        storage.save_draft(poll_id, user_id, selections, _user_info(user))
+        logger.info(
+            f"Selection update in poll {poll_id} from {user_id} -> {selections}",
+            extra={"event": "vote_selection", "user_id": user.id, "action": f"vote:{poll_id}"},
+        )
+        return action_text
 
-        poll.setdefault("users", {})[user_id] = {
-            "username": user.username,
-            "name": " ".join(filter(None, [user.first_name, user.last_name])).strip(),
-        }
-        state["polls"][poll_id] = poll
-        _save_state(state)
+    def _vote_error(call, exc):
+        # Ошибку голосования видит только проголосовавший — во всплывающем ответе
+        logger.error(f"Ошибка в callback '{call.data}' для пользователя {call.from_user.id}: {exc}", exc_info=exc)
+        try:
+            bot.answer_callback_query(call.id, "Не удалось учесть выбор, попробуйте ещё раз.")
+        except Exception as e:
+            logger.warning(f"Не удалось ответить на callback '{call.data}': {e}")
+
+    @router.route(prefix="vote_confirm:", on_error=_vote_error)
+    def handle_vote_confirm(call):
+        poll_id = call.data[len("vote_confirm:"):]
+        if not poll_id:
+            bot.answer_callback_query(call.id, "Invalid vote data.")
+            return
+
+        # Ответ Telegram отправляется уже после снятия блокировки опроса
+        with phase("vote_storage"), poll_locks.hold(poll_id):
+            answer = _confirm_vote(poll_id, call.from_user)
+        with phase("answer_callback"):
+            bot.answer_callback_query(call.id, answer)
+
+    @router.route(prefix="vote:", on_error=_vote_error)
+    def handle_vote_toggle(call):
+        try:
+            _, poll_id, option_idx = call.data.split(":", 2)
+            option_idx = int(option_idx)
+        except Exception:
+            bot.answer_callback_query(call.id, "Invalid vote data.")
+            return
 
-        bot.answer_callback_query(call.id, action_text)
-        logger.info(f"Selection update in poll {poll_id} from {user_id} -> {drafts[user_id]}")
+        with phase("vote_storage"), poll_locks.hold(poll_id):
+            answer = _toggle_option(poll_id, option_idx, call.from_user)
+        with phase("answer_callback"):
+            bot.answer_callback_query(call.id, answer)
@@ -0,0 +1,131 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+from media_cache import get_file_id, remember_file_id, photo_file_id
+from works import get_categories, list_category_photos, list_welcome_photos
+
+
+ALBUM_LIMIT = 10
+MAX_RETRIES = 3
+
+
+# ========================================================================
+#              ПРОГРЕВ: ЗАРАНЕЕ ЗАГРУЖАЕМ ВСЕ ФОТО В TELEGRAM
+# ========================================================================
+#
+# Фото загружаются в служебный («storage») чат, полученные file_id
+# попадают в кэш. Первый реальный пользователь уже не ждёт загрузки.
+
+
+def _collect_batches():
+    batches = [("welcome", [str(p) for p in list_welcome_photos()])]
+    for key, _title in get_categories():
+        batches.append((key, [str(p) for p in list_category_photos(key)]))
+    return batches
+
+
+def _retry_after(exc):
+    try:
+        return int(exc.result_json["parameters"]["retry_after"])
+    except Exception:
+        return None
+
+
+def _upload_chunk(bot, chat_id, paths):
+    open_files = []
+    try:
+        if len(paths) == 1:
+            with open(paths[0], "rb") as photo:
+                return [bot.send_photo(chat_id, photo)]
+
+        media = []
+        for path in paths:
+            f = open(path, "rb")
+            open_files.append(f)
+            media.append(types.InputMediaPhoto(f))
+        return bot.send_media_group(chat_id, media)
+    finally:
+        for f in open_files:
+            try:
+                f.close()
+            except Exception:
+                pass
+
+
+def _upload_batch(bot, chat_id, name, paths, logger):
+    """
+    Загружает фото одной категории пачками до 10 штук.
+    При 429 ждём столько, сколько просит Telegram, и повторяем.
+    """
+    started = time.monotonic()
+    uploaded = 0
+
+    for i in range(0, len(paths), ALBUM_LIMIT):
+        chunk = paths[i:i + ALBUM_LIMIT]
+        for attempt in range(MAX_RETRIES):
+            try:
+                messages = _upload_chunk(bot, chat_id, chunk)
+                break
+            except ApiTelegramException as e:
+                delay = _retry_after(e)
+                if e.error_code != 429 or delay is None or attempt == MAX_RETRIES - 1:
+                    raise
+                logger.warning(f"Прогрев '{name}': лимит Telegram, ждём {delay} с")
+                time.sleep(delay)
+
+        for path, message in zip(chunk, messages):
+            remember_file_id(path, photo_file_id(message))
+        uploaded += len(chunk)
+
+    return uploaded, time.monotonic() - started
+
+
+def warm_up(bot, storage_chat_id, logger, concurrency=4):
+    """
+    Загружает все ещё не закэшированные фото (приветствие + все категории)
+    с ограниченной параллельностью. Ошибки логируются и не мешают запуску бота.
+    """
+    started = time.monotonic()
+    batches = []
+    skipped = 0
+    for name, paths in _collect_batches():
+        pending = [path for path in paths if not get_file_id(path)]
+        skipped += len(paths) - len(pending)
+        if pending:
+            batches.append((name, pending))
+
+    total = sum(len(paths) for _, paths in batches)
+    logger.info(
+        f"Прогрев: к загрузке {total} фото в {len(batches)} разделах, "
+        f"уже в кэше {skipped}"
+    )
+    if not batches:
+        return
+
+    done = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(_upload_batch, bot, storage_chat_id, name, paths, logger): (name, paths)
+            for name, paths in batches
+        }
+        for future in as_completed(futures):
+            name, paths = futures[future]
+            try:
+                uploaded, elapsed = future.result()
+                done += uploaded
+                logger.info(
+                    f"Прогрев: '{name}' загружен ({uploaded} фото, {elapsed:.1f} с), "
+                    f"всего {done}/{total}"
+                )
+            except Exception as e:
+                failed += len(paths)
+                logger.error(f"Прогрев: ошибка при загрузке '{name}': {e}")
+
+    logger.info(
+        f"Прогрев завершён за {time.monotonic() - started:.1f} с: "
+        f"загружено {done}, с ошибками {failed}"
+    )
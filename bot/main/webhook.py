@@ -0,0 +1,139 @@
+import hmac
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+
+# ========================================================================
+#                 WEBHOOK: ПРИЁМ ОБНОВЛЕНИЙ ОТ TELEGRAM
+# ========================================================================
+#
+# HTTP-сервер принимает POST от Telegram, проверяет секретный токен
+# и кладёт тело запроса в ограниченную очередь. Рабочие потоки разбирают
+# обновления и передают их в обычные обработчики бота.
+# Если очередь заполнена — отвечаем 503, и Telegram повторит доставку позже.
+# Без секретного токена сервер отклоняет все запросы: иначе любой, кто
+# знает адрес, мог бы присылать боту поддельные обновления.
+# GET <path>/stats — та же проверка токена.
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, dispatch, secret_token, logger, host="0.0.0.0", port=8080,
+                 path="/telegram", queue_size=1000, workers=4):
+        self.dispatch = dispatch
+        self.secret_token = secret_token or ""
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stats_lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self._httpd = None
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_max": self.queue.maxsize,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+            }
+
+    def authorized(self, token):
+        if not self.secret_token:
+            return False
+        return hmac.compare_digest((token or "").encode("utf-8"), self.secret_token.encode("utf-8"))
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code, body=b"", content_type="text/plain", headers=None):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                if not server.authorized(self.headers.get(SECRET_HEADER)):
+                    self._reply(403)
+                    return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                try:
+                    server.queue.put_nowait(body)
+                except queue.Full:
+                    server._count("rejected")
+                    self._reply(503, headers={"Retry-After": "1"})
+                    return
+                server._count("accepted")
+                self._reply(200)
+
+            def do_GET(self):
+                if self.path != server.path + "/stats":
+                    self._reply(404)
+                    return
+                if not server.authorized(self.headers.get(SECRET_HEADER)):
+                    self._reply(403)
+                    return
+                body = json.dumps(server.stats()).encode("utf-8")
+                self._reply(200, body, content_type="application/json")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _worker(self):
+        while True:
+            body = self.queue.get()
+            try:
+                update = types.Update.de_json(body.decode("utf-8"))
+                self.dispatch([update])
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                self.logger.error(f"Ошибка при обработке обновления из webhook: {e}")
+            finally:
+                self.queue.task_done()
+
+    def serve_forever(self):
+        if not self.secret_token:
+            self.logger.warning("Webhook запущен без секретного токена — все запросы будут отклонены")
+        for i in range(max(1, self.workers)):
+            threading.Thread(target=self._worker, name=f"webhook-worker-{i}", daemon=True).start()
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.logger.info(f"Webhook слушает {self.host}:{self.port}{self.path}")
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def shutdown(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
@@ -1,7 +1,16 @@
+import os
+import threading
+import time
 from pathlib import Path
 
+from derivatives import build_derivatives, derivative_path
+from media_cache import prune as prune_file_ids
+
 
 MEDIA_ROOT = Path("media/works")
+WELCOME_ROOT = Path("media/welcome")
+WELCOME_PHOTO = WELCOME_ROOT / "fistphoto.jpg"
+ABOUT_PHOTO = WELCOME_ROOT / "Photo.jpg"
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
 
 CATEGORY_TITLES = {
@@ -33,7 +42,48 @@ CATEGORY_ORDER = [
 ]
 
 
-def get_categories():
+_refresh_lock = threading.Lock()
+_catalog = None
+
+
+# ========================================================================
+#                  ИНДЕКС КАТЕГОРИЙ И ФОТО В ПАМЯТИ
+# ========================================================================
+#
+# Обработчики кнопок читают только готовый индекс и не обращаются к диску.
+# Индекс перестраивается, когда меняется mtime одной из папок (добавили,
+# удалили или переименовали файл/категорию) или размер/mtime одного из фото
+# (файл перезаписали под тем же именем — mtime папки при этом не меняется).
+# Проверку делает фоновый поток.
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _dir_mtimes(category_keys):
+    mtimes = {str(MEDIA_ROOT): _mtime(MEDIA_ROOT), str(WELCOME_ROOT): _mtime(WELCOME_ROOT)}
+    for key in category_keys:
+        folder = MEDIA_ROOT / key
+        mtimes[str(folder)] = _mtime(folder)
+    return mtimes
+
+
+def _file_stats(paths):
+    stats = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats[str(path)] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stats[str(path)] = None
+    return stats
+
+
+def _scan_categories():
     if not MEDIA_ROOT.exists():
         return []
 
@@ -50,13 +100,100 @@ def get_categories():
     return categories
 
 
-def list_category_photos(category):
-    category_dir = MEDIA_ROOT / category
-    if not category_dir.is_dir():
+def _list_images(folder):
+    if not folder.is_dir():
         return []
 
     files = [
-        path for path in category_dir.iterdir()
+        path for path in folder.iterdir()
         if path.is_file() and path.suffix.lower() in IMAGE_EXTS
     ]
     return sorted(files, key=lambda p: p.name.lower())
+
+
+def refresh_catalog(logger=None):
+    """
+    Перестраивает индекс, если изменилась хотя бы одна папка или фото.
+    Заодно пересобирает уменьшенные копии изменившихся фото.
+    Возвращает True, если индекс был перестроен.
+    """
+    global _catalog
+    with _refresh_lock:
+        catalog = _catalog
+        if (
+            catalog is not None
+            and _dir_mtimes(catalog["photos"]) == catalog["mtimes"]
+            and _file_stats(catalog["files"]) == catalog["files"]
+        ):
+            return False
+
+        categories = _scan_categories()
+        mtimes = _dir_mtimes(key for key, _title in categories)
+        welcome = _list_images(WELCOME_ROOT)
+        originals = {key: _list_images(MEDIA_ROOT / key) for key, _title in categories}
+
+        sources = list(welcome)
+        for paths in originals.values():
+            sources.extend(paths)
+        files = _file_stats(sources)
+        build_derivatives(sources, logger=logger)
+
+        _catalog = {
+            "categories": categories,
+            "photos": {
+                key: [derivative_path(path) for path in paths]
+                for key, paths in originals.items()
+            },
+            "welcome": [derivative_path(path) for path in welcome],
+            "mtimes": mtimes,
+            "files": files,
+        }
+        pruned = prune_file_ids(derivative_path(path) for path in sources)
+
+    if logger:
+        logger.info(
+            f"Индекс работ обновлён: {len(categories)} категорий, {len(sources)} фото, "
+            f"устаревших file_id удалено: {pruned}"
+        )
+    return True
+
+
+def _get_catalog():
+    catalog = _catalog
+    if catalog is None:
+        refresh_catalog()
+        catalog = _catalog
+    return catalog
+
+
+def start_catalog_watcher(interval, logger=None):
+    """
+    Фоновая проверка папок и фото (размер, mtime) раз в interval секунд.
+    """
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                refresh_catalog(logger=logger)
+            except Exception as e:
+                if logger:
+                    logger.error(f"Ошибка при обновлении индекса работ: {e}")
+
+    thread = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_categories():
+    return list(_get_catalog()["categories"])
+
+
+def list_category_photos(category):
+    """
+    Фото категории для отправки: уменьшенные копии, если они подготовлены.
+    """
+    return list(_get_catalog()["photos"].get(category, []))
+
+
+def list_welcome_photos():
+    return list(_get_catalog()["welcome"])